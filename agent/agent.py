@@ -1,62 +1,74 @@
-import base64
-from bs4 import BeautifulSoup
+import hashlib
+import json
 import logging
 import os
-import google.generativeai as genai
-import json
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from agent.cache import get_analysis_cache
+from agent.extract import extract_email_content
+from agent.triage import triage_emails
+from llm_client import lazy_client
+from metrics import propagate
+from singleflight import SingleFlight
+from state_backend import get_state_backend, run_once
+from structured_output import BatchEmailAnalysis, EmailAnalysis, generate_json, parse_json, validate_items, json_generation_config
 
 # --- Configuration ---
-load_dotenv()
-
-try:
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY not found in .env file.")
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    logging.info("Gmail Agent: Gemini API configured successfully.")
-except Exception as e:
-    logging.error(f"Gmail Agent: Error configuring Gemini API: {e}")
-    model = None
-
-def analyze_emails(emails):
-    """
-    Analyzes a list of emails using the Gemini API to extract to-dos.
-    """
-    if not model:
-        return {"todos": [], "team_updates": []} # Return empty structure on error
+# Rate limiting, timeouts and retries are handled by the shared LLM client.
+model = lazy_client("gmail_agent")
 
-    todos = []
-    for email in emails:
-        try:
-            payload = email.get("payload", {})
-            headers = payload.get("headers", [])
-            
-            subject = ""
-            sender = ""
-            for header in headers:
-                if header["name"].lower() == "subject":
-                    subject = header["value"]
-                if header["name"].lower() == "from":
-                    sender = header["value"]
-
-            body_html = ""
-            if "parts" in payload:
-                for part in payload["parts"]:
-                    if part["mimeType"] == "text/html":
-                        data = part["body"].get("data")
-                        if data:
-                            body_html = base64.urlsafe_b64decode(data).decode("utf-8")
-                        break
-            elif "body" in payload and "data" in payload["body"]:
-                data = payload["body"]["data"]
-                body_html = base64.urlsafe_b64decode(data).decode("utf-8")
-
-            soup = BeautifulSoup(body_html, "lxml")
-            text_body = soup.get_text(separator="\n", strip=True)[:4000]
-
-            prompt = f"""
+# --- Concurrency ---
+MAX_CONCURRENCY = int(os.getenv("GMAIL_AGENT_MAX_CONCURRENCY", "8"))
+
+# --- Batching ---
+# In batch mode several emails share one prompt, so the instructions are only
+# sent once per batch. Batches are bounded by an approximate token budget.
+BATCH_MODE = os.getenv("GMAIL_AGENT_BATCH_MODE", "true").lower() == "true"
+BATCH_TOKEN_BUDGET = int(os.getenv("GMAIL_AGENT_BATCH_TOKEN_BUDGET", "12000"))
+BATCH_MAX_EMAILS = int(os.getenv("GMAIL_AGENT_BATCH_MAX_EMAILS", "20"))
+CHARS_PER_TOKEN = 4
+
+# --- Triage ---
+# Clear negatives (promotions, bulk mail, notifications) are dropped by a local
+# heuristic pass before any LLM call. See agent/triage.py.
+TRIAGE_ENABLED = os.getenv("GMAIL_AGENT_TRIAGE", "true").lower() == "true"
+
+# Bump whenever the prompts or result format change so cached analyses made
+# with an older prompt are not reused.
+PROMPT_VERSION = "2"
+
+# Identical concurrent analysis runs (e.g. several dashboards loading the same
+# inbox at once) share one execution instead of each calling the model: within
+# a process through analysis_flight, and across worker processes through a
+# lease on the shared state backend, whose holder publishes its result there.
+analysis_flight = SingleFlight()
+RUN_LOCK_SECONDS = float(os.getenv("GMAIL_AGENT_RUN_LOCK_SECONDS", "180"))
+RUN_RESULT_TTL_SECONDS = 60
+RUNS_NAMESPACE = "analysis_runs"
+
+# Marks an analysis that failed (as opposed to "not a to-do"); never cached.
+_FAILED = object()
+_DEFAULT = object()
+
+def _parse_email(email):
+    """Extracts the sender, subject and a plain-text body snippet (with its links) from a Gmail message."""
+    payload = email.get("payload", {})
+    headers = payload.get("headers", [])
+
+    subject = ""
+    sender = ""
+    for header in headers:
+        if header["name"].lower() == "subject":
+            subject = header["value"]
+        if header["name"].lower() == "from":
+            sender = header["value"]
+
+    text_body, links = extract_email_content(payload)
+    if links:
+        text_body += "\nLinks: " + " ".join(links)
+    return sender, subject, text_body
+
+def _build_prompt(sender, subject, text_body):
+    return f"""
             Analyze the content of the following email.
             
             From: {sender}
@@ -70,20 +82,251 @@ def analyze_emails(emails):
             Respond with a single JSON object with the keys "is_todo", "summary", and "link".
             """
 
-            logging.info(f"Analyzing email for to-dos from {sender} with subject '{subject}'...")
-            response = model.generate_content(prompt)
-            
-            cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
-            analysis = json.loads(cleaned_response)
+def _to_todo(analysis, subject):
+    if analysis.is_todo:
+        return {
+            "task": analysis.summary or subject,
+            "link": analysis.link
+        }
+    return None
+
+def _analyze_email(client, parsed):
+    """Analyzes a single parsed email. Returns a to-do dict, or None if it is not a to-do."""
+    _, sender, subject, text_body = parsed
+    try:
+        prompt = _build_prompt(sender, subject, text_body)
+
+        logging.info(f"Analyzing email for to-dos from {sender} with subject '{subject}'...")
+        analysis = generate_json(client, prompt, EmailAnalysis)
+        return _to_todo(analysis, subject)
+
+    except Exception as e:
+        logging.error(f"Could not process email for to-do: {subject}. Error: {e}")
+    return _FAILED
+
+def _estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
 
-            if analysis.get("is_todo") == "yes":
-                todos.append({
-                    "task": analysis.get("summary", subject),
-                    "link": analysis.get("link", "")
-                })
+def _chunk_by_budget(parsed_emails, token_budget=BATCH_TOKEN_BUDGET, max_emails=BATCH_MAX_EMAILS):
+    """Groups parsed emails into batches whose estimated prompt size fits `token_budget`."""
+    batches = []
+    current = []
+    current_tokens = 0
+    for parsed in parsed_emails:
+        _, sender, subject, text_body = parsed
+        tokens = _estimate_tokens(sender) + _estimate_tokens(subject) + _estimate_tokens(text_body)
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_emails):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(parsed)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
 
+def _build_batch_prompt(batch):
+    emails_block = "\n".join(
+        f"""
+            --- Email ID: {message_id} ---
+            From: {sender}
+            Subject: {subject}
+            Body Snippet: {text_body}
+            """
+        for message_id, sender, subject, text_body in batch
+    )
+    return f"""
+            Analyze each of the following {len(batch)} emails independently.
+            {emails_block}
+
+            For each email:
+            1.  **Classification**: Is this email a 'to-do' that requires a direct action from the recipient? Answer 'yes' or 'no'.
+            2.  **Summary**: If it is a 'to-do', provide a concise one-sentence summary of the required action.
+            3.  **Link**: Extract the single most relevant hyperlink from the email body, if one exists.
+
+            Respond with a single JSON array containing exactly one object per email, each with the keys
+            "id" (the Email ID above), "is_todo", "summary", and "link".
+            """
+
+def _parse_batch_response(text):
+    """
+    Maps a batch response back to {message_id: BatchEmailAnalysis}.
+
+    Malformed or truncated output is salvaged as far as possible, so only the
+    entries that are missing or invalid need a retry.
+    """
+    try:
+        items = validate_items(parse_json(text, many=True), BatchEmailAnalysis)
+    except ValueError as e:
+        logging.error(f"Could not parse batch response: {e}")
+        return {}
+    return {item.id: item for item in items}
+
+def _analyze_batch(client, batch):
+    """
+    Analyzes a batch of parsed emails with a single prompt.
+
+    Returns {message_id: to-do or None}. Emails missing or invalid in the
+    response are re-analyzed individually. If the call itself fails (after the
+    client's retries), every email in the batch is marked failed rather than
+    re-sent one by one, which would only multiply the load on an exhausted quota.
+    """
+    results = {}
+    try:
+        logging.info(f"Analyzing a batch of {len(batch)} emails for to-dos...")
+        response = client.generate_content(
+            _build_batch_prompt(batch), generation_config=json_generation_config(BatchEmailAnalysis, many=True)
+        )
+        text = response.text
+    except Exception as e:
+        logging.error(f"Could not process email batch of {len(batch)}. Error: {e}")
+        return {parsed[0]: _FAILED for parsed in batch}
+    analyses = _parse_batch_response(text)
+
+    for parsed in batch:
+        message_id, _, subject, _ = parsed
+        if message_id in analyses:
+            results[message_id] = _to_todo(analyses[message_id], subject)
+        else:
+            logging.warning(f"Gmail Agent: no batch result for '{subject}', falling back to a single call.")
+            results[message_id] = _analyze_email(client, parsed)
+    return results
+
+def _parse_emails(emails):
+    parsed_emails = []
+    for index, email in enumerate(emails):
+        try:
+            message_id = str(email["id"]) if email.get("id") else f"#{index}"
+            parsed_emails.append((message_id, *_parse_email(email)))
         except Exception as e:
-            logging.error(f"Could not process email for to-do: {subject}. Error: {e}")
-            continue
+            logging.error(f"Could not parse email {email.get('id', index)}. Error: {e}")
+    return parsed_emails
+
+def _iter_results(parsed_emails, client, max_concurrency, batch, token_budget, cache):
+    """
+    Yields (message_id, result) pairs as soon as each analysis is available.
+
+    Cached results come first, then fresh ones in completion order; fresh results
+    are written back to the cache as they arrive.
+    """
+    if cache is _DEFAULT:
+        cache = get_analysis_cache()
+    cached = {}
+    if cache is not None:
+        cacheable_ids = [parsed[0] for parsed in parsed_emails if not parsed[0].startswith("#")]
+        cached = cache.get_many(cacheable_ids, PROMPT_VERSION)
+        if cached:
+            logging.info(f"Gmail Agent: {len(cached)}/{len(parsed_emails)} analyses served from cache.")
+    yield from cached.items()
+
+    pending = [parsed for parsed in parsed_emails if parsed[0] not in cached]
+    if not pending:
+        return
+    if batch:
+        jobs = _chunk_by_budget(pending, token_budget)
+        run = lambda job: _analyze_batch(client, job)
+    else:
+        jobs = pending
+        run = lambda job: {job[0]: _analyze_email(client, job)}
+
+    workers = max(1, min(max_concurrency, len(jobs)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gmail-agent") as executor:
+        for future in as_completed([executor.submit(propagate(run), job) for job in jobs]):
+            job_results = future.result()
+            if cache is not None:
+                cache.set_many(
+                    {message_id: todo for message_id, todo in job_results.items()
+                     if todo is not _FAILED and not message_id.startswith("#")},
+                    PROMPT_VERSION,
+                )
+            yield from job_results.items()
+
+def _triage(emails, triage):
+    if not triage:
+        return emails
+    to_analyze, _ = triage_emails(emails)
+    return to_analyze
+
+def iter_todos(emails, model_client=None, max_concurrency=MAX_CONCURRENCY, batch=BATCH_MODE,
+               token_budget=BATCH_TOKEN_BUDGET, cache=_DEFAULT, triage=TRIAGE_ENABLED):
+    """
+    Streaming variant of analyze_emails: yields each to-do as soon as its email is analyzed.
+
+    To-dos are yielded in completion order rather than email order. Raises
+    RuntimeError once done if every email failed to be analyzed.
+    """
+    client = model_client or model
+    if not client:
+        return
+    parsed_emails = _parse_emails(_triage(emails or [], triage))
+    failed = 0
+    for _, todo in _iter_results(parsed_emails, client, max_concurrency, batch, token_budget, cache):
+        if todo is _FAILED:
+            failed += 1
+        elif todo:
+            yield todo
+    if failed and failed == len(parsed_emails):
+        raise RuntimeError(_failure_message(failed))
+
+def analyze_emails(emails, model_client=None, max_concurrency=MAX_CONCURRENCY, batch=BATCH_MODE,
+                   token_budget=BATCH_TOKEN_BUDGET, cache=_DEFAULT, triage=TRIAGE_ENABLED):
+    """
+    Analyzes a list of emails using the Gemini API to extract to-dos.
+
+    Emails are analyzed concurrently on a thread pool of at most `max_concurrency`
+    workers; to-dos are returned in the original email order. With `batch` enabled,
+    emails are packed into multi-email prompts bounded by `token_budget`.
+    `model_client` is any object with a `generate_content(prompt)` method and
+    defaults to the shared Gemini client (wrap a stub in `llm_client.get_client`
+    to keep rate limiting and metrics). Results are cached per message ID
+    in `cache` (the shared analysis cache by default, None to disable), so only
+    messages not seen before are sent to the model. With `triage` enabled,
+    clearly non-actionable emails are skipped without an LLM call.
+
+    Emails whose analysis failed (e.g. quota or server errors) are counted under
+    "failed"; if every email failed, the result also carries an "error".
+
+    Concurrent calls with the default client and cache for the same messages
+    and settings are coalesced onto one run whose result they share, across
+    worker processes too.
+    """
+    if model_client is None and cache is _DEFAULT:
+        key = (tuple(email.get("id") for email in emails or []), max_concurrency, batch, token_budget, triage)
+        return analysis_flight.do(key, _analyze_shared, key, emails, max_concurrency, batch, token_budget, triage)
+    return _analyze_emails(emails, model_client, max_concurrency, batch, token_budget, cache, triage)
+
+def _analyze_shared(key, emails, max_concurrency, batch, token_budget, triage):
+    """Runs the analysis in one worker process at a time; the others pick up its published result."""
+    backend = get_state_backend()
+    digest = hashlib.sha256(json.dumps([PROMPT_VERSION, *key]).encode("utf-8")).hexdigest()
+
+    def _compute():
+        backend.delete(RUNS_NAMESPACE, digest)  # Never hand out an earlier run's result as this one's.
+        result = _analyze_emails(emails, None, max_concurrency, batch, token_budget, _DEFAULT, triage)
+        backend.set(RUNS_NAMESPACE, digest, result, ttl_seconds=RUN_RESULT_TTL_SECONDS)
+        return result
+
+    return run_once(
+        backend, f"analysis:{digest}", _compute, lambda: backend.get(RUNS_NAMESPACE, digest), RUN_LOCK_SECONDS
+    )
+
+def _analyze_emails(emails, model_client, max_concurrency, batch, token_budget, cache, triage):
+    client = model_client or model
+    if not client:
+        return {"todos": [], "team_updates": []} # Return empty structure on error
+    parsed_emails = _parse_emails(_triage(emails or [], triage))
+    if not parsed_emails:
+        return {"todos": []}
+
+    results = dict(_iter_results(parsed_emails, client, max_concurrency, batch, token_budget, cache))
+    todos = [results.get(parsed[0]) for parsed in parsed_emails]
+    analysis = {"todos": [todo for todo in todos if todo and todo is not _FAILED]}
+    failed = sum(1 for todo in todos if todo is _FAILED)
+    if failed:
+        analysis["failed"] = failed
+        if failed == len(parsed_emails):
+            analysis["error"] = _failure_message(failed)
+    return analysis
 
-    return {"todos": todos}
+def _failure_message(failed):
+    return f"Could not analyze any of the {failed} emails; the Gemini API calls failed."
@@ -0,0 +1,94 @@
+import os
+import threading
+from state_backend import get_state_backend
+
+CACHE_TTL_SECONDS = int(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "5000"))
+
+class AnalysisCache:
+    """
+    Cache of per-email analysis results on the shared state backend, so every
+    worker process reuses every other worker's analyses.
+
+    Entries are keyed by Gmail message ID and prompt version, since a message's
+    content never changes but its analysis does whenever the prompt does. Entries
+    expire after `ttl_seconds`, and the oldest are evicted once a prompt
+    version holds more than `max_entries`.
+    """
+
+    def __init__(self, backend, ttl_seconds=CACHE_TTL_SECONDS, max_entries=CACHE_MAX_ENTRIES):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prompt_version = None  # The last one used, for `entries` in stats().
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _namespace(prompt_version):
+        return f"analysis:{prompt_version}"
+
+    def get_many(self, message_ids, prompt_version):
+        self.prompt_version = prompt_version
+        if not message_ids:
+            return {}
+        # Stored as {"result": ...} so a cached "not a to-do" (None) is distinguishable from a miss.
+        found = {
+            message_id: entry["result"]
+            for message_id, entry in self.backend.get_many(self._namespace(prompt_version), message_ids).items()
+        }
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(message_ids) - len(found)
+        return found
+
+    def get(self, message_id, prompt_version, default=None):
+        return self.get_many([message_id], prompt_version).get(message_id, default)
+
+    def set_many(self, results, prompt_version):
+        self.prompt_version = prompt_version
+        if not results:
+            return
+        namespace = self._namespace(prompt_version)
+        self.backend.set_many(
+            namespace,
+            {message_id: {"result": result} for message_id, result in results.items()},
+            ttl_seconds=self.ttl_seconds,
+        )
+        evicted = self.backend.trim(namespace, self.max_entries)
+        with self._lock:
+            self.evictions += evicted
+
+    def set(self, message_id, prompt_version, result):
+        self.set_many({message_id: result}, prompt_version)
+
+    def stats(self):
+        """Counters for this process; `entries` counts the shared entries for the current prompt version."""
+        prompt_version = self.prompt_version
+        entries = self.backend.count(self._namespace(prompt_version)) if prompt_version is not None else 0
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": f"shared ({type(self.backend).__name__})",
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_analysis_cache():
+    """Returns the process-wide analysis cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnalysisCache(get_state_backend())
+    return _cache
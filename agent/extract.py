@@ -0,0 +1,133 @@
+import base64
+import codecs
+import re
+from html.parser import HTMLParser
+from metrics import span
+
+MAX_BODY_CHARS = 4000
+MAX_LINKS = 10
+# Base64 input is decoded in chunks of this many characters (a multiple of 4),
+# so a huge body is only decoded as far as the character budget needs.
+DECODE_CHUNK_CHARS = 16384
+
+_SKIPPED_TAGS = {"script", "style", "head", "title", "noscript", "template"}
+_URL_PATTERN = re.compile(r"https?://[^\s<>\"')\]]+")
+
+class _BudgetReached(Exception):
+    pass
+
+class _HTMLTextExtractor(HTMLParser):
+    """
+    Incremental HTML-to-text converter that stops once `max_chars` are collected.
+
+    Produces the same shape of text as BeautifulSoup's get_text("\\n", strip=True)
+    (one stripped, non-empty text node per line) and collects href links in the
+    same pass.
+    """
+
+    def __init__(self, max_chars, max_links):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.max_links = max_links
+        self.lines = []
+        self.links = []
+        self.length = 0
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIPPED_TAGS:
+            self._skip_depth += 1
+        elif tag == "a" and len(self.links) < self.max_links:
+            href = dict(attrs).get("href")
+            if href and href.startswith(("http://", "https://")) and href not in self.links:
+                self.links.append(href)
+
+    def handle_endtag(self, tag):
+        if tag in _SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        text = data.strip()
+        if not text:
+            return
+        self.lines.append(text)
+        self.length += len(text) + 1
+        if self.length >= self.max_chars:
+            raise _BudgetReached()
+
+def _iter_decoded(data, chunk_chars=DECODE_CHUNK_CHARS):
+    """Yields the text of a base64url-encoded UTF-8 body, one chunk at a time."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    chunk_chars -= chunk_chars % 4
+    for start in range(0, len(data), chunk_chars):
+        chunk = data[start:start + chunk_chars]
+        if start + chunk_chars >= len(data):
+            chunk += "=" * (-len(chunk) % 4)
+        yield decoder.decode(base64.urlsafe_b64decode(chunk))
+    yield decoder.decode(b"", final=True)
+
+def _find_parts(payload, plain=None, html=None):
+    """Walks the MIME tree depth-first and returns the first text/plain and text/html bodies."""
+    mime_type = payload.get("mimeType", "")
+    data = payload.get("body", {}).get("data")
+    if data and not payload.get("filename"):
+        if mime_type == "text/plain" and plain is None:
+            plain = data
+        elif mime_type == "text/html" and html is None:
+            html = data
+    for part in payload.get("parts", []):
+        if plain is not None and html is not None:
+            break
+        plain, html = _find_parts(part, plain, html)
+    return plain, html
+
+def html_to_text(chunks, max_chars=MAX_BODY_CHARS, max_links=MAX_LINKS):
+    """Converts HTML (an iterable of text chunks) to text, stopping at `max_chars`. Returns (text, links)."""
+    parser = _HTMLTextExtractor(max_chars, max_links)
+    try:
+        for chunk in chunks:
+            parser.feed(chunk)
+        parser.close()
+    except _BudgetReached:
+        pass
+    return "\n".join(parser.lines)[:max_chars], parser.links
+
+def plain_to_text(chunks, max_chars=MAX_BODY_CHARS, max_links=MAX_LINKS):
+    """Collects plain text up to `max_chars`. Returns (text, links)."""
+    collected = []
+    length = 0
+    for chunk in chunks:
+        collected.append(chunk)
+        length += len(chunk)
+        if length >= max_chars:
+            break
+    text = "\n".join(line.strip() for line in "".join(collected)[:max_chars].splitlines() if line.strip())
+    links = list(dict.fromkeys(_URL_PATTERN.findall(text)))[:max_links]
+    return text, links
+
+def extract_email_content(payload, max_chars=MAX_BODY_CHARS, max_links=MAX_LINKS):
+    """
+    Extracts a text snippet and hyperlinks from a Gmail message payload.
+
+    Walks nested multipart payloads, prefers the text/plain body when there is
+    one (falling back to text/html), and decodes and converts only as much of
+    the body as the `max_chars` budget needs. Returns (text, links).
+    """
+    with span("email.extract"):
+        return _extract_email_content(payload, max_chars, max_links)
+
+def _extract_email_content(payload, max_chars, max_links):
+    plain, html = _find_parts(payload)
+    if plain:
+        text, links = plain_to_text(_iter_decoded(plain), max_chars, max_links)
+        if text:
+            if html and len(links) < max_links:
+                # Plain-text parts often omit the links the HTML part carries.
+                _, html_links = html_to_text(_iter_decoded(html), max_chars, max_links)
+                links = list(dict.fromkeys(links + html_links))[:max_links]
+            return text, links
+    if html:
+        return html_to_text(_iter_decoded(html), max_chars, max_links)
+    return "", []
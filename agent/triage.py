@@ -0,0 +1,160 @@
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# Emails scoring at or below this are treated as clearly non-actionable and
+# never sent to the LLM.
+SKIP_THRESHOLD = int(os.getenv("TRIAGE_SKIP_THRESHOLD", "-3"))
+
+# Comma-separated addresses or domains (e.g. "boss@google.com,google.com").
+ALLOW_SENDERS = [s.strip().lower() for s in os.getenv("TRIAGE_ALLOW_SENDERS", "").split(",") if s.strip()]
+DENY_SENDERS = [s.strip().lower() for s in os.getenv("TRIAGE_DENY_SENDERS", "").split(",") if s.strip()]
+
+LABEL_SCORES = {
+    "CATEGORY_PROMOTIONS": -4,
+    "CATEGORY_SOCIAL": -4,
+    "CATEGORY_FORUMS": -2,
+    "CATEGORY_UPDATES": -1,
+    "IMPORTANT": 2,
+    "STARRED": 3,
+}
+
+POSITIVE_PATTERNS = [
+    (re.compile(p, re.IGNORECASE), score) for p, score in [
+        (r"\baction (required|needed)\b", 4),
+        (r"\b(please|pls) (review|approve|confirm|sign|respond|reply|complete|submit)\b", 4),
+        (r"\b(deadline|due (by|date|today|tomorrow)|by (eod|end of day|tomorrow))\b", 3),
+        (r"\b(rsvp|approval|sign-off|review requested|assigned to you|mentioned you)\b", 3),
+        (r"\b(can you|could you|would you|need you to)\b", 2),
+        (r"\?\s*$", 1),
+    ]
+]
+
+NEGATIVE_PATTERNS = [
+    (re.compile(p, re.IGNORECASE), score) for p, score in [
+        (r"\b(newsletter|digest|weekly roundup|this week in)\b", -3),
+        (r"\b(\d+% off|sale|deal|discount|promo(tion)?|coupon|limited time)\b", -3),
+        (r"\b(your (order|receipt|invoice|statement)|order confirmation|has shipped)\b", -2),
+        (r"\b(webinar|unsubscribe|view (this|it) in your browser)\b", -2),
+    ]
+]
+
+# Message IDs remembered for de-duplicating the stats; roughly a week of mail.
+STATS_MAX_MESSAGES = int(os.getenv("TRIAGE_STATS_MAX_MESSAGES", "50000"))
+
+_NO_REPLY_PATTERN = re.compile(r"\b(no-?reply|do-?not-?reply|notifications?|mailer-daemon)@", re.IGNORECASE)
+_ADDRESS_PATTERN = re.compile(r"<([^>]+)>")
+
+class TriageStats:
+    """
+    Counts how many emails triage let through and how many LLM analyses it saved.
+
+    The same inbox is triaged on every refresh, but an email is analyzed (and
+    its result cached) at most once, so each message ID is counted only the
+    first time it is seen; `passes` counts every evaluation.
+    """
+
+    def __init__(self, max_messages=STATS_MAX_MESSAGES):
+        self.checked = 0
+        self.skipped = 0
+        self.passes = 0
+        self.reasons = {}
+        self.max_messages = max_messages
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, skipped, reasons, message_id=None):
+        with self._lock:
+            self.passes += 1
+            if message_id is not None:
+                if message_id in self._seen:
+                    self._seen.move_to_end(message_id)
+                    return
+                self._seen[message_id] = None
+                if len(self._seen) > self.max_messages:
+                    self._seen.popitem(last=False)
+            self.checked += 1
+            if skipped:
+                self.skipped += 1
+                for reason in reasons:
+                    self.reasons[reason] = self.reasons.get(reason, 0) + 1
+
+    def report(self):
+        with self._lock:
+            return {
+                "passes": self.passes,
+                "checked": self.checked,
+                "skipped": self.skipped,
+                "llm_analyses_saved": self.skipped,
+                "skip_rate": round(self.skipped / self.checked, 3) if self.checked else 0.0,
+                "skip_reasons": dict(self.reasons),
+            }
+
+stats = TriageStats()
+
+def _headers(email):
+    return {h["name"].lower(): h["value"] for h in email.get("payload", {}).get("headers", [])}
+
+def _sender_address(sender):
+    match = _ADDRESS_PATTERN.search(sender)
+    return (match.group(1) if match else sender).strip().lower()
+
+def _matches(address, entries):
+    domain = address.rpartition("@")[2]
+    return any(entry == address or entry == domain for entry in entries)
+
+def score_email(email):
+    """
+    Scores an email's likelihood of being actionable from labels, headers,
+    sender and subject keywords. Returns (score, reasons).
+    """
+    headers = _headers(email)
+    address = _sender_address(headers.get("from", ""))
+    if _matches(address, ALLOW_SENDERS):
+        return 100, ["allow_list"]
+    if _matches(address, DENY_SENDERS):
+        return -100, ["deny_list"]
+
+    score = 0
+    reasons = []
+    for label in email.get("labelIds", []):
+        if label in LABEL_SCORES:
+            score += LABEL_SCORES[label]
+            reasons.append(label.lower())
+    if "list-unsubscribe" in headers:
+        score -= 2
+        reasons.append("list_unsubscribe")
+    if "list-id" in headers:
+        score -= 1
+        reasons.append("mailing_list")
+    if headers.get("precedence", "").lower() in ("bulk", "list", "junk"):
+        score -= 3
+        reasons.append("precedence_bulk")
+    if headers.get("auto-submitted", "no").lower() != "no":
+        score -= 3
+        reasons.append("auto_submitted")
+    if _NO_REPLY_PATTERN.search(address):
+        score -= 2
+        reasons.append("no_reply_sender")
+
+    text = f"{headers.get('subject', '')}\n{email.get('snippet', '')}"
+    for pattern, pattern_score in POSITIVE_PATTERNS + NEGATIVE_PATTERNS:
+        if pattern.search(text):
+            score += pattern_score
+            reasons.append("keyword_positive" if pattern_score > 0 else "keyword_negative")
+    return score, reasons
+
+def triage_emails(emails, threshold=SKIP_THRESHOLD):
+    """Splits `emails` into (to_analyze, skipped) without any LLM call."""
+    to_analyze = []
+    skipped = []
+    for email in emails:
+        score, reasons = score_email(email)
+        skip = score <= threshold
+        stats.record(skip, reasons, email.get("id"))
+        (skipped if skip else to_analyze).append(email)
+    if skipped:
+        logging.info(f"Triage: skipped {len(skipped)} of {len(emails)} emails as non-actionable without an LLM call.")
+    return to_analyze, skipped
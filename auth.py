@@ -1,8 +1,13 @@
-import os.path
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+import datetime
+import logging
+import os
+import tempfile
+import threading
+from context_manager import validate_user_id
+from singleflight import SingleFlight
+
+# The Google client libraries are imported inside the functions that use them:
+# they are slow to import and only needed once a Google API is first called.
 
 # Define all the scopes your application needs here
 SCOPES = [
@@ -10,32 +15,155 @@ SCOPES = [
     "https://www.googleapis.com/auth/calendar.readonly"
 ]
 
-def get_google_credentials():
+TOKEN_FILE = "token.json"
+CLIENT_SECRETS_FILE = "credentials.json"
+# Additional users' tokens live in TOKEN_DIR/<user_id>.json; the default user
+# (no user ID) keeps TOKEN_FILE.
+TOKEN_DIR = os.getenv("FRIDAY_TOKEN_DIR", "tokens")
+
+# Refresh a little before the access token actually expires, so a request never
+# starts with a token that dies mid-flight.
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+HTTP_TIMEOUT = 60
+
+_credentials = {}  # user_id -> Credentials
+# Concurrent loads or refreshes of one user's credentials share a single
+# execution; different users refresh independently.
+refresh_flight = SingleFlight()
+
+# httplib2 connections are not thread-safe, so each worker thread keeps its own
+# service clients (and with them a persistent HTTP connection pool).
+_thread_local = threading.local()
+
+class MissingCredentialsError(Exception):
+    """Raised for a non-default user who has no stored authorization."""
+
+def _needs_refresh(creds):
+    if not creds.valid:
+        return True
+    expiry = creds.expiry
+    return expiry is not None and expiry - REFRESH_MARGIN <= datetime.datetime.utcnow()
+
+def http_status(error):
+    """The HTTP status of a Google API error (an HttpError) as an int, or None if it has none."""
+    status = getattr(getattr(error, "resp", None), "status", None)
+    return int(status) if status is not None else None
+
+def token_file(user_id=None):
+    """Path of the stored OAuth token for `user_id` (or the default user)."""
+    if user_id is None:
+        return TOKEN_FILE
+    return os.path.join(TOKEN_DIR, f"{validate_user_id(user_id)}.json")
+
+def has_credentials(user_id=None):
+    """
+    True for the default user and for users with a stored token. Only the
+    default user can be authorized interactively; other users' tokens are
+    provisioned into TOKEN_DIR.
+    """
+    return user_id is None or user_id in _credentials or os.path.exists(token_file(user_id))
+
+def _save_credentials(creds, user_id=None):
+    """
+    Writes the token file atomically: the JSON goes to a temporary file in the
+    same directory which then replaces the old file, so readers (including
+    other worker processes) never see a partially written token.
+    """
+    path = token_file(user_id)
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".token-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as token:
+            token.write(creds.to_json())
+            token.flush()
+            os.fsync(token.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+def get_google_credentials(user_id=None):
     """
     Handles user authentication and token management for all Google APIs.
-    Returns valid credentials.
-    """
-    creds = None
-    if os.path.exists("token.json"):
-        creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-    
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
+    Returns valid credentials for `user_id` (or the default user).
+
+    Credentials are loaded once per process and refreshed proactively shortly
+    before they expire. Concurrent callers for the same user wait for a single
+    load or refresh and share its result.
+    """
+    creds = _credentials.get(user_id)
+    if creds is not None and not _needs_refresh(creds):
+        return creds
+    return refresh_flight.do(user_id, _load_credentials, user_id)
+
+def _load_credentials(user_id):
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+
+    path = token_file(user_id)
+    # A refresh that finished just before this flight started has already done the work.
+    creds = _credentials.get(user_id)
+    if creds is None and os.path.exists(path):
+        creds = Credentials.from_authorized_user_file(path, SCOPES)
+
+    if not creds or _needs_refresh(creds):
+        if creds and creds.refresh_token:
+            logging.info("Refreshing Google credentials...")
             creds.refresh(Request())
+        elif user_id is not None:
+            # Never block a server thread on an interactive OAuth flow for an API caller.
+            raise MissingCredentialsError(f"No stored Google authorization for user {user_id!r}.")
         else:
-            flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
+            flow = InstalledAppFlow.from_client_secrets_file(CLIENT_SECRETS_FILE, SCOPES)
             creds = flow.run_local_server(port=0)
-        
-        with open("token.json", "w") as token:
-            token.write(creds.to_json())
+        _save_credentials(creds, user_id)
+
+    _credentials[user_id] = creds
     return creds
 
-def get_gmail_service():
-    """Returns an authenticated Gmail service client."""
-    creds = get_google_credentials()
-    return build("gmail", "v1", credentials=creds)
+def build_service(api, version, creds):
+    """Builds a service client from the bundled (static) discovery document."""
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build
+
+    http = AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    return build(api, version, http=http, static_discovery=True, cache_discovery=False)
+
+def get_service(api, version, user_id=None):
+    """
+    Returns an authenticated service client, built at most once per thread.
+
+    The client is rebuilt only if the underlying credentials object changes
+    (e.g. after re-authorization); in-place refreshes reuse it.
+    """
+    creds = get_google_credentials(user_id)
+    services = getattr(_thread_local, "services", None)
+    if services is None:
+        services = _thread_local.services = {}
+    cached = services.get((api, version, user_id))
+    if cached is None or cached[0] is not creds:
+        cached = (creds, build_service(api, version, creds))
+        services[(api, version, user_id)] = cached
+    return cached[1]
+
+def get_gmail_service(user_id=None):
+    """Returns an authenticated Gmail service client for `user_id` (or the default user)."""
+    return get_service("gmail", "v1", user_id)
+
+def get_calendar_service(user_id=None):
+    """Returns an authenticated Calendar service client for `user_id` (or the default user)."""
+    return get_service("calendar", "v3", user_id)
 
-def get_calendar_service():
-    """Returns an authenticated Calendar service client."""
-    creds = get_google_credentials()
-    return build("calendar", "v3", credentials=creds)
+def warm_up():
+    """Imports the Google client libraries ahead of the first API call."""
+    import httplib2
+    import google_auth_httplib2
+    import google.oauth2.credentials
+    import google.auth.transport.requests
+    import googleapiclient.discovery
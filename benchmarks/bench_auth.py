@@ -0,0 +1,44 @@
+"""
+Measures per-request Google client setup cost: building a discovery client on
+every request (the old path) versus the process-wide cached clients in auth.py.
+
+Runs offline: it uses anonymous credentials and the discovery documents bundled
+with google-api-python-client, so no token.json or network access is needed.
+
+    python -m benchmarks.bench_auth [iterations]
+"""
+import statistics
+import sys
+import time
+
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.discovery import build
+
+import auth
+
+def _time(func, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+def _report(label, samples):
+    print(f"{label:<38} first={samples[0]:8.2f}ms  median={statistics.median(samples):8.3f}ms  "
+          f"max={max(samples):8.2f}ms")
+
+def main(iterations=50):
+    creds = AnonymousCredentials()
+    # Stand in for token.json so get_service() exercises only the caching path.
+    auth._credentials = {None: creds}
+    auth._needs_refresh = lambda _: False
+
+    for api, version in (("gmail", "v1"), ("calendar", "v3")):
+        print(f"--- {api} {version} ({iterations} iterations) ---")
+        _report("build() per request (uncached)", _time(lambda: build(api, version, credentials=creds), iterations))
+        _report("build_service() static discovery", _time(lambda: auth.build_service(api, version, creds), iterations))
+        _report("get_service() cached", _time(lambda: auth.get_service(api, version), iterations))
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
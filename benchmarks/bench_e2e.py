@@ -0,0 +1,153 @@
+"""
+Drives the FastAPI endpoints in main.py under concurrent load, fully offline.
+
+Gmail and Calendar are replaced by fake discovery clients serving a synthetic
+inbox and calendar, and every agent's Gemini model by a stub with configurable
+latency, per-token cost and error rate. The real app code runs in between:
+triage, extraction, caches, the rate-limited LLM client, stores and the
+precompute scheduler. For each endpoint it reports latency (first request,
+p50, p95, max), throughput, errors, API calls and LLM tokens.
+
+State (mailbox store, caches, sessions) lives in a temporary FRIDAY_CACHE_DIR,
+so the first request of a run is cold and later ones see warm caches.
+
+    python -m benchmarks.bench_e2e [--requests N] [--concurrency N] [--emails N]
+        [--endpoints today_summary,calendar,recommendations,chat,chat_stream]
+        [--api-latency-ms MS] [--llm-latency-ms MS] [--llm-ms-per-token MS]
+        [--llm-error-rate P] [--precompute]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ENDPOINTS = {
+    "today_summary": ("GET", "/api/today_summary?include_calendar=true", None),
+    "calendar": ("GET", "/api/calendar/today", None),
+    "recommendations": ("GET", "/api/recommendations", None),
+    "chat": ("POST", "/api/friday/chat", "How do I request a new laptop?"),
+    "chat_stream": ("POST", "/api/friday/chat/stream", "What's next?"),
+}
+
+def _configure_environment(args):
+    """Must run before main is imported: the app reads its configuration at import time."""
+    os.environ["FRIDAY_CACHE_DIR"] = tempfile.mkdtemp(prefix="friday-bench-")
+    os.environ["PRECOMPUTE_ENABLED"] = "true" if args.precompute else "false"
+    os.environ["FRIDAY_FAST_STARTUP"] = "true"
+    os.environ["FRIDAY_TOKEN_DIR"] = os.path.join(os.environ["FRIDAY_CACHE_DIR"], "tokens")
+    # Measure the app rather than the production quota, unless one is given explicitly.
+    os.environ.setdefault("GEMINI_REQUESTS_PER_MINUTE", "100000")
+    os.environ.setdefault("GEMINI_TOKENS_PER_MINUTE", "100000000")
+
+def _install_fakes(args, counter):
+    """Swaps the Google clients and Gemini models used by main.py for the offline fakes."""
+    import calendar_integration.service
+    import friday_chatbot_agent
+    import llm_client
+    import main
+    from benchmarks.fakes import FakeCalendarService, FakeGmailService, StubModel, make_calendar, make_inbox
+
+    inbox = make_inbox(args.emails, args.newsletter_ratio, args.body_kb)
+    events = make_calendar(args.events)
+    api_latency = args.api_latency_ms / 1000
+    # Discovery clients are not thread-safe, so (like auth.get_service) each call gets its own.
+    main.get_gmail_service = lambda user_id=None: FakeGmailService(inbox, counter, api_latency)
+    main.get_calendar_service = lambda user_id=None: FakeCalendarService(events, counter, api_latency)
+    calendar_integration.service.get_calendar_service = main.get_calendar_service
+
+    def get_client(agent, model=None, **model_kwargs):
+        stub = StubModel(
+            agent, counter, latency=args.llm_latency_ms / 1000, seconds_per_token=args.llm_ms_per_token / 1000,
+            error_rate=args.llm_error_rate, system_instruction=model_kwargs.get("system_instruction"),
+        )
+        return llm_client.LLMClient(agent, model=model or stub)
+
+    llm_client.get_client = get_client
+    friday_chatbot_agent.get_client = get_client
+    return main
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+async def _run_endpoint(client, name, requests, concurrency):
+    method, path, message = ENDPOINTS[name]
+    latencies = [None] * requests  # In issue order, so latencies[0] is the first (cold) request.
+    errors = 0
+    issued = iter(range(requests))
+
+    async def _worker(worker):
+        nonlocal errors
+        for i in issued:
+            body = {"message": message, "session_id": f"bench-{worker}"} if message else None
+            started = time.perf_counter()
+            response = await client.request(method, path, json=body)
+            await response.aread()
+            latencies[i] = (time.perf_counter() - started) * 1000
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_worker(w) for w in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+def _report(name, latencies, errors, elapsed, calls):
+    api_calls = {key: count for key, count in calls.items() if key.startswith(("gmail.", "calendar."))}
+    print(f"--- {name}: {len(latencies)} requests, {errors} errors ---")
+    print(f"  latency   first={latencies[0]:8.1f}ms  p50={statistics.median(latencies):8.1f}ms  "
+          f"p95={_percentile(latencies, 0.95):8.1f}ms  max={max(latencies):8.1f}ms")
+    print(f"  throughput {len(latencies) / elapsed:7.2f} req/s over {elapsed:.2f}s")
+    print(f"  LLM       calls={calls.get('llm.calls', 0)}  errors={calls.get('llm.errors', 0)}  "
+          f"prompt_tokens={calls.get('llm.prompt_tokens', 0)}  response_tokens={calls.get('llm.response_tokens', 0)}")
+    if api_calls:
+        print("  API       " + "  ".join(f"{key}={count}" for key, count in sorted(api_calls.items())))
+
+async def _run(args, main, counter):
+    import httpx
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            if args.precompute:
+                await asyncio.gather(*(s.wait_ready(list(s.stages), timeout=300) for s in main.schedulers.values()))
+            for name in args.endpoints:
+                before = counter.snapshot()
+                latencies, errors, elapsed = await _run_endpoint(client, name, args.requests, args.concurrency)
+                _report(name, latencies, errors, elapsed, counter.snapshot() - before)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS),
+                        type=lambda value: [name.strip() for name in value.split(",") if name.strip()])
+    parser.add_argument("--emails", type=int, default=100, help="unread messages in the synthetic inbox")
+    parser.add_argument("--newsletter-ratio", type=float, default=0.5)
+    parser.add_argument("--body-kb", type=int, default=8, help="size of each newsletter's HTML body")
+    parser.add_argument("--events", type=int, default=8, help="calendar events today")
+    parser.add_argument("--api-latency-ms", type=float, default=50, help="per Gmail/Calendar round trip")
+    parser.add_argument("--llm-latency-ms", type=float, default=400, help="per Gemini call")
+    parser.add_argument("--llm-ms-per-token", type=float, default=2, help="per response token")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="fraction of Gemini calls failing with a 503")
+    parser.add_argument("--precompute", action="store_true",
+                        help="run the background scheduler and benchmark the snapshot-serving path")
+    args = parser.parse_args()
+    unknown = [name for name in args.endpoints if name not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)} (choose from {', '.join(ENDPOINTS)})")
+
+    from benchmarks.fakes import CallCounter
+
+    _configure_environment(args)
+    counter = CallCounter()
+    app_main = _install_fakes(args, counter)
+    print(f"inbox={args.emails} emails  concurrency={args.concurrency}  api_latency={args.api_latency_ms}ms  "
+          f"llm_latency={args.llm_latency_ms}ms  llm_error_rate={args.llm_error_rate}  "
+          f"precompute={args.precompute}  state={os.environ['FRIDAY_CACHE_DIR']}")
+    asyncio.run(_run(args, app_main, counter))
+
+if __name__ == "__main__":
+    sys.exit(main())
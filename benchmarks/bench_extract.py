@@ -0,0 +1,91 @@
+"""
+Compares email body extraction: the previous approach (decode the whole HTML
+part, build a full BeautifulSoup/lxml DOM, then truncate) against the streaming
+extractor in agent/extract.py, over a corpus of large synthetic emails.
+
+    python -m benchmarks.bench_extract [emails] [newsletter_kb]
+"""
+import base64
+import random
+import statistics
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+from agent.extract import extract_email_content
+
+def _b64(text):
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+def _newsletter_html(size_kb, rng):
+    blocks = []
+    size = 0
+    blocks.append("<html><head><style>" + ".c{color:red}" * 200 + "</style></head><body>")
+    while size < size_kb * 1024:
+        n = rng.randint(0, 10**6)
+        block = (f'<table><tr><td><h2>Story {n}</h2><p>Lorem ipsum dolor sit amet &amp; more text '
+                 f'for item {n}, consectetur adipiscing elit.</p>'
+                 f'<a href="https://example.com/story/{n}">Read more</a></td></tr></table>')
+        blocks.append(block)
+        size += len(block)
+    blocks.append("</body></html>")
+    return "".join(blocks)
+
+def make_corpus(count=50, newsletter_kb=512, seed=7):
+    """Builds a mix of single-part HTML newsletters and nested multipart/alternative messages."""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        html = _newsletter_html(newsletter_kb, rng)
+        if i % 2:
+            payload = {"mimeType": "text/html", "body": {"data": _b64(html)}}
+        else:
+            plain = "\n".join(f"Line {j} of the plain text version https://example.com/{j}" for j in range(2000))
+            payload = {
+                "mimeType": "multipart/mixed",
+                "parts": [
+                    {"mimeType": "multipart/alternative", "parts": [
+                        {"mimeType": "text/plain", "body": {"data": _b64(plain)}},
+                        {"mimeType": "text/html", "body": {"data": _b64(html)}},
+                    ]},
+                    {"mimeType": "application/pdf", "filename": "a.pdf", "body": {"attachmentId": "x"}},
+                ],
+            }
+        corpus.append(payload)
+    return corpus
+
+def legacy_extract(payload):
+    """The extraction agent/agent.py used before agent/extract.py (top-level text/html part only)."""
+    body_html = ""
+    if "parts" in payload:
+        for part in payload["parts"]:
+            if part["mimeType"] == "text/html":
+                data = part["body"].get("data")
+                if data:
+                    body_html = base64.urlsafe_b64decode(data).decode("utf-8")
+                break
+    elif "body" in payload and "data" in payload["body"]:
+        body_html = base64.urlsafe_b64decode(payload["body"]["data"]).decode("utf-8")
+    soup = BeautifulSoup(body_html, "lxml")
+    return soup.get_text(separator="\n", strip=True)[:4000]
+
+def _bench(label, func, corpus):
+    samples = []
+    for payload in corpus:
+        started = time.perf_counter()
+        func(payload)
+        samples.append((time.perf_counter() - started) * 1000)
+    print(f"{label:<28} total={sum(samples):9.1f}ms  median={statistics.median(samples):8.2f}ms  "
+          f"p95={sorted(samples)[int(len(samples) * 0.95) - 1]:8.2f}ms")
+    return sum(samples)
+
+def main(count=50, newsletter_kb=512):
+    corpus = make_corpus(count, newsletter_kb)
+    print(f"--- {count} emails, ~{newsletter_kb}KB HTML each ---")
+    legacy = _bench("BeautifulSoup (legacy)", legacy_extract, corpus)
+    streaming = _bench("agent.extract (streaming)", extract_email_content, corpus)
+    print(f"speedup: {legacy / streaming:.1f}x")
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
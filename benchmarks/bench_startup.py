@@ -0,0 +1,71 @@
+"""
+Measures the cold-start cost of importing main.py, so startup regressions show
+up before they reach every uvicorn worker spawn.
+
+Runs `python -X importtime -c "import main"` in fresh interpreters, reports the
+median wall time and the import time spent in each top-level package,
+and exits non-zero if the median exceeds `--max-ms` (for CI).
+
+    python -m benchmarks.bench_startup [--runs N] [--top N] [--max-ms MS] [--module main]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+def _import_once(module):
+    """Imports `module` in a fresh interpreter. Returns (wall_ms, {package: import_us})."""
+    env = dict(os.environ, FRIDAY_FAST_STARTUP="true", PRECOMPUTE_ENABLED="false")
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env,
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        sys.exit(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    packages = {}
+    for line in result.stderr.splitlines():
+        # "import time: <self us> | <cumulative us> | <indented module name>"
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|", 2)
+        # Attribute each module's own import time to its top-level package, so
+        # the report reads "pydantic: 40ms" rather than listing hundreds of modules.
+        root = name.strip().split(".")[0]
+        packages[root] = packages.get(root, 0) + int(self_us)
+    return wall_ms, packages
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if the median import time exceeds this")
+    parser.add_argument("--module", default="main")
+    args = parser.parse_args()
+
+    samples = []
+    packages = {}
+    for _ in range(args.runs):
+        wall_ms, run_packages = _import_once(args.module)
+        samples.append(wall_ms)
+        for name, import_us in run_packages.items():
+            packages.setdefault(name, []).append(import_us)
+
+    median = statistics.median(samples)
+    print(f"import {args.module}: median={median:.1f}ms  min={min(samples):.1f}ms  max={max(samples):.1f}ms  "
+          f"({args.runs} cold runs, interpreter start included)")
+    print("\nImport time by top-level package (median of runs):")
+    ranked = sorted(((statistics.median(v) / 1000, k) for k, v in packages.items()), reverse=True)
+    for import_ms, name in ranked[:args.top]:
+        print(f"  {import_ms:9.1f}ms  {name}")
+
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"\nFAIL: median {median:.1f}ms exceeds --max-ms {args.max_ms:.1f}ms")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
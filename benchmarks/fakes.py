@@ -0,0 +1,315 @@
+"""
+Offline stand-ins for the Gmail and Calendar discovery clients and the Gemini
+models, used by the end-to-end benchmark.
+
+They implement just the request shapes the app uses, add a configurable
+latency per API round trip or LLM call, and count every call in a shared
+CallCounter so a benchmark can report API calls and tokens per endpoint.
+"""
+import base64
+import datetime
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from types import SimpleNamespace
+
+CHARS_PER_TOKEN = 4
+
+class CallCounter:
+    """Thread-safe counters keyed by call name ("gmail.messages.get", "llm.calls", ...)."""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return Counter(self._counts)
+
+class _Request:
+    """A prepared API request, as returned by discovery client methods."""
+
+    def __init__(self, counter, name, latency, respond):
+        self._counter = counter
+        self._name = name
+        self._latency = latency
+        self._respond = respond
+
+    def execute(self):
+        self._counter.add(self._name)
+        time.sleep(self._latency)
+        return self._respond()
+
+class _Batch:
+    """A batch HTTP request: one round trip however many requests it carries."""
+
+    def __init__(self, counter, latency, callback):
+        self._counter = counter
+        self._latency = latency
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, request_id=None):
+        self._requests.append((request_id, request))
+
+    def execute(self):
+        self._counter.add("gmail.batch")
+        time.sleep(self._latency)
+        for request_id, request in self._requests:
+            self._counter.add(request._name)
+            # Like the real batch, a failed request is reported to the callback
+            # instead of failing the whole batch.
+            try:
+                response = request._respond()
+            except Exception as error:
+                self._callback(request_id, None, error)
+            else:
+                self._callback(request_id, response, None)
+
+def _b64(text):
+    return base64.urlsafe_b64encode(text.encode("utf-8")).decode("ascii")
+
+def make_inbox(count=100, newsletter_ratio=0.5, body_kb=8, seed=7):
+    """
+    Builds `count` unread messages received today: newsletters with large HTML
+    bodies (which triage should skip) and short direct requests.
+    """
+    rng = random.Random(seed)
+    now_ms = int(time.time() * 1000)
+    messages = []
+    for i in range(count):
+        message_id = f"m{i:05d}"
+        if rng.random() < newsletter_ratio:
+            sender = f"Weekly Digest <news{i % 7}@updates.example.com>"
+            subject = f"Your weekly digest #{i}"
+            labels = ["UNREAD", "INBOX", "CATEGORY_PROMOTIONS"]
+            stories = "".join(
+                f'<tr><td><h2>Story {j}</h2><p>Lorem ipsum dolor sit amet, item {j}.</p>'
+                f'<a href="https://example.com/story/{j}">Read more</a></td></tr>'
+                for j in range(max(1, body_kb * 1024 // 120))
+            )
+            body = {"mimeType": "text/html", "body": {"data": _b64(f"<html><body><table>{stories}</table></body></html>")}}
+            extra_headers = [{"name": "List-Unsubscribe", "value": "<https://example.com/unsubscribe>"}]
+        else:
+            sender = f"Colleague {i} <colleague{i}@example.com>"
+            subject = f"Can you review design doc {i} by Friday?"
+            labels = ["UNREAD", "INBOX", "IMPORTANT"]
+            text = f"Hi, could you please review the doc at https://docs.example.com/d/{i} and leave comments?"
+            body = {"mimeType": "text/plain", "body": {"data": _b64(text)}}
+            extra_headers = []
+        messages.append({
+            "id": message_id,
+            "threadId": message_id,
+            "labelIds": labels,
+            "internalDate": str(now_ms - i * 1000),
+            "historyId": "1000",
+            "snippet": subject,
+            "payload": {
+                **body,
+                "headers": [{"name": "From", "value": sender}, {"name": "Subject", "value": subject}] + extra_headers,
+            },
+        })
+    return messages
+
+class FakeGmailService:
+    """
+    Serves a synthetic inbox through the subset of the Gmail API the app uses:
+    messages.list/get (including batch requests), getProfile and history.list
+    (which reports no changes, so repeat syncs are incremental no-ops).
+    """
+
+    def __init__(self, messages, counter, latency=0.05, page_size=100):
+        self._messages = {message["id"]: message for message in messages}
+        self._ids = [message["id"] for message in messages]
+        self._counter = counter
+        self._latency = latency
+        self._page_size = page_size
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def history(self):
+        return _GmailHistory(self)
+
+    def getProfile(self, userId):
+        return _Request(self._counter, "gmail.getProfile", self._latency, lambda: {"historyId": "1000"})
+
+    def list(self, userId, q=None, maxResults=100, pageToken=None, **_):
+        start = int(pageToken or 0)
+        end = start + min(maxResults, self._page_size)
+
+        def _respond():
+            page = {"messages": [{"id": i, "threadId": i} for i in self._ids[start:end]]}
+            if end < len(self._ids):
+                page["nextPageToken"] = str(end)
+            return page
+        return _Request(self._counter, "gmail.messages.list", self._latency, _respond)
+
+    def get(self, userId, id, **_):
+        return _Request(self._counter, "gmail.messages.get", self._latency, lambda: json.loads(json.dumps(self._messages[id])))
+
+    def new_batch_http_request(self, callback=None):
+        return _Batch(self._counter, self._latency, callback)
+
+class _GmailHistory:
+    def __init__(self, gmail):
+        self._gmail = gmail
+
+    def list(self, userId, startHistoryId, **_):
+        return _Request(self._gmail._counter, "gmail.history.list", self._gmail._latency,
+                        lambda: {"history": [], "historyId": startHistoryId})
+
+def make_calendar(count=8, seed=7):
+    """Builds `count` one-hour events spread over today (UTC)."""
+    rng = random.Random(seed)
+    today = datetime.datetime.now(datetime.timezone.utc).replace(hour=8, minute=0, second=0, microsecond=0)
+    events = []
+    for i in range(count):
+        start = today + datetime.timedelta(minutes=30 * rng.randint(0, 20))
+        events.append({
+            "id": f"e{i:04d}",
+            "status": "confirmed",
+            "summary": f"Meeting {i}",
+            "hangoutLink": f"https://meet.example.com/e{i}",
+            "start": {"dateTime": start.isoformat()},
+            "end": {"dateTime": (start + datetime.timedelta(hours=1)).isoformat()},
+        })
+    return events
+
+class FakeCalendarService:
+    """Serves `events` from events.list; requests with a syncToken report no changes."""
+
+    def __init__(self, events, counter, latency=0.05):
+        self._events = events
+        self._counter = counter
+        self._latency = latency
+
+    def events(self):
+        return self
+
+    def list(self, calendarId, syncToken=None, **_):
+        def _respond():
+            items = [] if syncToken else json.loads(json.dumps(self._events))
+            return {"items": items, "nextSyncToken": "sync-1", "timeZone": "UTC"}
+        return _Request(self._counter, "calendar.events.list", self._latency, _respond)
+
+# --- Gemini ---
+class StubLLMError(Exception):
+    """A transient error; `code` makes the shared LLM client retry it like a 503."""
+    code = 503
+
+_EMAIL_ID_PATTERN = re.compile(r"--- Email ID: (\S+) ---")
+
+def _fake_value(schema, name, prompt, rng):
+    kind = schema.get("type")
+    if kind == "OBJECT":
+        return {key: _fake_value(value, key, prompt, rng) for key, value in schema["properties"].items()}
+    if kind == "ARRAY":
+        items = schema["items"]
+        if items.get("type") == "OBJECT" and "id" in items.get("properties", {}):
+            # A batch email analysis: one verdict per email ID in the prompt.
+            return [
+                {**_fake_value(items, name, prompt, rng), "id": message_id}
+                for message_id in _EMAIL_ID_PATTERN.findall(prompt)
+            ]
+        return [_fake_value(items, name, prompt, rng) for _ in range(3)]
+    if kind == "BOOLEAN":
+        return rng.random() < 0.5
+    if kind in ("INTEGER", "NUMBER"):
+        return rng.randint(1, 10)
+    if name == "link":
+        return "http://go/benchmark"
+    return f"Synthetic {name or 'text'} {rng.randint(0, 999)}"
+
+class StubModel:
+    """
+    Stands in for a GenerativeModel.
+
+    Each call sleeps `latency` seconds plus `seconds_per_token` per response
+    token and fails with StubLLMError at `error_rate`. JSON-mode calls get a
+    random but schema-valid answer; other calls get a short comma-separated text.
+    """
+
+    def __init__(self, agent, counter, latency=0.4, seconds_per_token=0.002, error_rate=0.0,
+                 system_instruction=None, seed=7):
+        self.agent = agent
+        self.model_name = "stub-model"
+        self._counter = counter
+        self._latency = latency
+        self._seconds_per_token = seconds_per_token
+        self._error_rate = error_rate
+        self._system_instruction = system_instruction or ""
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def _answer(self, prompt, generation_config):
+        rng = random.Random(zlib.crc32(prompt.encode("utf-8")))
+        schema = (generation_config or {}).get("response_schema")
+        if schema:
+            return json.dumps(_fake_value(schema, None, prompt, rng))
+        return ", ".join(f"Synthetic topic {rng.randint(0, 999)}" for _ in range(3))
+
+    def _respond(self, prompt_text, generation_config=None, stream=False):
+        with self._rng_lock:
+            failed = self._rng.random() < self._error_rate
+        self._counter.add("llm.calls")
+        self._counter.add(f"llm.calls.{self.agent}")
+        if failed:
+            time.sleep(self._latency / 2)
+            self._counter.add("llm.errors")
+            raise StubLLMError("Stub LLM: simulated 503")
+        text = self._answer(prompt_text, generation_config)
+        prompt_tokens = (len(self._system_instruction) + len(prompt_text)) // CHARS_PER_TOKEN + 1
+        response_tokens = len(text) // CHARS_PER_TOKEN + 1
+        self._counter.add("llm.prompt_tokens", prompt_tokens)
+        self._counter.add("llm.response_tokens", response_tokens)
+        usage = SimpleNamespace(prompt_token_count=prompt_tokens, candidates_token_count=response_tokens)
+        if stream:
+            return _StubStream(text, usage, self._latency, self._seconds_per_token)
+        time.sleep(self._latency + response_tokens * self._seconds_per_token)
+        return SimpleNamespace(text=text, usage_metadata=usage)
+
+    def generate_content(self, contents, stream=False, generation_config=None, **_):
+        return self._respond(str(contents), generation_config, stream)
+
+    def start_chat(self, history=None):
+        return _StubChat(self, history or [])
+
+class _StubStream:
+    """A streamed response: a first chunk after `latency`, then one chunk per few tokens."""
+
+    def __init__(self, text, usage, latency, seconds_per_token):
+        self.text = text
+        self.usage_metadata = usage
+        self._latency = latency
+        self._seconds_per_token = seconds_per_token
+
+    def __iter__(self):
+        time.sleep(self._latency)
+        words = self.text.split(" ")
+        for i in range(0, len(words), 4):
+            chunk = " ".join(words[i:i + 4]) + " "
+            time.sleep(len(chunk) // CHARS_PER_TOKEN * self._seconds_per_token)
+            yield SimpleNamespace(text=chunk)
+
+class _StubChat:
+    def __init__(self, model, history):
+        self._model = model
+        self.history = list(history)
+
+    def send_message(self, content, stream=False, **_):
+        replayed = " ".join(" ".join(str(part) for part in turn["parts"]) for turn in self.history)
+        response = self._model._respond(f"{replayed} {content}", stream=stream)
+        self.history.append({"role": "user", "parts": [content]})
+        return response
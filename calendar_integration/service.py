@@ -1,34 +1,218 @@
+from concurrent.futures import ThreadPoolExecutor
 from googleapiclient.errors import HttpError
-from auth import get_calendar_service
+from auth import get_calendar_service, http_status
+from calendar_integration.store import get_event_store
+from metrics import propagate, span
+from singleflight import SingleFlight
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 import datetime
+import os
 
-def get_todays_calendar_events(service):
-    """Fetches today's events from the user's primary calendar."""
+# Comma-separated calendar IDs to sync, e.g. "primary,team@group.calendar.google.com".
+CALENDAR_IDS = [c.strip() for c in os.getenv("CALENDAR_IDS", "primary").split(",") if c.strip()]
+# Overrides the primary calendar's time zone for "today", e.g. "America/Los_Angeles".
+USER_TIMEZONE = os.getenv("FRIDAY_TIMEZONE")
+# The initial sync covers events from this many days ago onward; older events
+# are pruned from the local store.
+SYNC_PAST_DAYS = int(os.getenv("CALENDAR_SYNC_PAST_DAYS", "30"))
+PAGE_SIZE = 250
+MAX_CONCURRENT_CALENDARS = 4
+
+# Only the pieces of an event we read, plus the paging and sync tokens.
+EVENT_FIELDS = (
+    "nextPageToken,nextSyncToken,timeZone,"
+    "items(id,status,summary,hangoutLink,htmlLink,start,end)"
+)
+
+_DEFAULT = object()
+
+# Concurrent syncs of the same calendars into the same store share one run.
+sync_flight = SingleFlight()
+
+def _resolve_timezone(name):
+    if name:
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            print(f"Unknown time zone '{name}'; using the server's local time zone.")
+    return datetime.datetime.now().astimezone().tzinfo
+
+def _parse_time(value, tz):
+    """Converts an event start/end ({"dateTime"} or all-day {"date"}) to epoch milliseconds."""
+    if "dateTime" in value:
+        moment = datetime.datetime.fromisoformat(value["dateTime"])
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=tz)
+    else:
+        moment = datetime.datetime.combine(datetime.date.fromisoformat(value["date"]), datetime.time.min, tzinfo=tz)
+    return int(moment.timestamp() * 1000)
+
+def _with_times(events, tz):
+    timed = []
+    for event in events:
+        try:
+            timed.append((event, _parse_time(event["start"], tz), _parse_time(event["end"], tz)))
+        except (KeyError, ValueError) as error:
+            print(f"Skipping event {event.get('id')} with an unreadable time: {error}")
+    return timed
+
+def list_events(service, calendar_id, fields=EVENT_FIELDS, **query):
+    """
+    Lists every event matching `query`, following nextPageToken.
+
+    Returns (events, next_sync_token, time_zone).
+    """
+    events = []
+    page_token = None
+    while True:
+        request_kwargs = {"calendarId": calendar_id, "singleEvents": True, "maxResults": PAGE_SIZE, **query}
+        if fields:
+            request_kwargs["fields"] = fields
+        if page_token:
+            request_kwargs["pageToken"] = page_token
+        with span("calendar.list"):
+            results = service.events().list(**request_kwargs).execute()
+        events.extend(results.get("items", []))
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            return events, results.get("nextSyncToken"), results.get("timeZone")
+
+def full_sync(service, store, calendar_id, fields=EVENT_FIELDS):
+    """Re-downloads a calendar's events from SYNC_PAST_DAYS ago onward and records its syncToken."""
+    time_min = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=SYNC_PAST_DAYS)
+    events, sync_token, time_zone = list_events(service, calendar_id, fields=fields, timeMin=time_min.isoformat())
+    events = [event for event in events if event.get("status") != "cancelled"]
+    store.replace_calendar(calendar_id, _with_times(events, _resolve_timezone(time_zone)), sync_token, time_zone)
+    print(f"Full calendar sync of '{calendar_id}' fetched {len(events)} events.")
+    return events
+
+def incremental_sync(service, store, calendar_id, fields=EVENT_FIELDS):
+    """
+    Applies the changes since the stored syncToken.
+
+    Cancelled events are removed from the store and changed ones replaced.
+    Raises HttpError (410) if the syncToken has expired.
+    """
+    sync_token, stored_time_zone = store.get_sync_state(calendar_id)
+    events, next_sync_token, time_zone = list_events(service, calendar_id, fields=fields, syncToken=sync_token)
+    cancelled = [event["id"] for event in events if event.get("status") == "cancelled"]
+    changed = [event for event in events if event.get("status") != "cancelled"]
+    store.put_events(calendar_id, _with_times(changed, _resolve_timezone(time_zone or stored_time_zone)))
+    store.delete_events(calendar_id, cancelled)
+    store.set_sync_state(calendar_id, next_sync_token or sync_token, time_zone)
+    print(f"Incremental calendar sync of '{calendar_id}' applied {len(events)} changes.")
+    return changed
+
+def sync_calendar(service, store, calendar_id, fields=EVENT_FIELDS):
+    """Brings one calendar in the local store up to date, falling back to a full sync when needed."""
+    if store.get_sync_state(calendar_id)[0]:
+        try:
+            return incremental_sync(service, store, calendar_id, fields=fields)
+        except HttpError as error:
+            # Calendar reports an expired syncToken as 410 Gone.
+            if http_status(error) != 410:
+                raise
+            print(f"syncToken for '{calendar_id}' has expired; falling back to a full sync.")
+    return full_sync(service, store, calendar_id, fields=fields)
+
+def sync_calendars(store, calendar_ids=None, service=None, service_factory=get_calendar_service):
+    """
+    Syncs several calendars concurrently.
+
+    Each worker thread uses its own client from `service_factory`, since API
+    clients are not thread-safe; a single calendar is synced with `service`.
+    Returns the IDs of calendars that failed to sync.
+    """
+    calendar_ids = calendar_ids or CALENDAR_IDS
+    store.prune_before(_start_of_window_ms())
+
+    def _sync(calendar_id, client=None):
+        try:
+            sync_calendar(client or service_factory(), store, calendar_id)
+            return None
+        except HttpError as error:
+            print(f"An error occurred syncing calendar '{calendar_id}': {error}")
+            return calendar_id
+
+    if len(calendar_ids) == 1:
+        failed = [_sync(calendar_ids[0], service)]
+    else:
+        workers = min(MAX_CONCURRENT_CALENDARS, len(calendar_ids))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="calendar-sync") as executor:
+            failed = list(executor.map(propagate(_sync), calendar_ids))
+    return [calendar_id for calendar_id in failed if calendar_id]
+
+def _start_of_window_ms():
+    start = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=SYNC_PAST_DAYS)
+    return int(start.timestamp() * 1000)
+
+def get_user_timezone(store=None):
+    """The user's time zone: FRIDAY_TIMEZONE, else the synced primary calendar's, else the server's."""
+    if USER_TIMEZONE:
+        return _resolve_timezone(USER_TIMEZONE)
+    time_zone = store.get_sync_state(CALENDAR_IDS[0])[1] if store is not None else None
+    return _resolve_timezone(time_zone)
+
+def _day_bounds(day, tz):
+    start = datetime.datetime.combine(day, datetime.time.min, tzinfo=tz)
+    return start, start + datetime.timedelta(days=1)
+
+def _format_event(event):
+    return {
+        "summary": event.get("summary", "No Title"),
+        "link": event.get("hangoutLink", ""),
+        "start_time": event["start"].get("dateTime", event["start"].get("date")),
+        "end_time": event["end"].get("dateTime", event["end"].get("date")),
+    }
+
+def get_events_between(start, end, store=_DEFAULT, calendar_ids=None):
+    """Returns the stored events overlapping [start, end) (aware datetimes) without calling the API."""
+    if store is _DEFAULT:
+        store = get_event_store()
+    if store is None:
+        return []
+    events = store.get_events(
+        int(start.timestamp() * 1000), int(end.timestamp() * 1000), calendar_ids or CALENDAR_IDS
+    )
+    return [_format_event(event) for event in events]
+
+def get_todays_calendar_events(service, store=_DEFAULT, calendar_ids=None, service_factory=get_calendar_service):
+    """
+    Fetches today's events (in the user's time zone) from the configured calendars.
+
+    By default the shared event store is synced incrementally with syncTokens
+    and today's events are served from it; pass `store=None` to query the API
+    for today's window directly. `service_factory` builds the per-thread clients
+    used when several calendars are synced concurrently. Calendars that fail to
+    sync are served as last synced; returns None if no events could be fetched.
+    """
+    if store is _DEFAULT:
+        store = get_event_store()
     try:
-        now = datetime.datetime.utcnow().isoformat() + 'Z'  # 'Z' indicates UTC time
-        today_start = datetime.datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0).isoformat() + 'Z'
-        today_end = datetime.datetime.utcnow().replace(hour=23, minute=59, second=59, microsecond=999999).isoformat() + 'Z'
-
-        events_result = service.events().list(
-            calendarId='primary', 
-            timeMin=today_start,
-            timeMax=today_end,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-        
-        events = events_result.get('items', [])
-        
-        formatted_events = []
-        for event in events:
-            start = event['start'].get('dateTime', event['start'].get('date'))
-            formatted_events.append({
-                "summary": event.get("summary", "No Title"),
-                "link": event.get("hangoutLink", ""),
-                "start_time": start
-            })
-        return formatted_events
+        if store is not None:
+            requested = tuple(calendar_ids or CALENDAR_IDS)
+            failed = sync_flight.do(
+                (store, requested), sync_calendars, store, calendar_ids, service=service, service_factory=service_factory,
+            )
+            never_synced = [calendar_id for calendar_id in failed if store.get_sync_state(calendar_id)[0] is None]
+            if len(never_synced) == len(requested):
+                return None  # Nothing to fall back on.
+            tz = get_user_timezone(store)
+            start, end = _day_bounds(datetime.datetime.now(tz).date(), tz)
+            return get_events_between(start, end, store=store, calendar_ids=calendar_ids)
+
+        tz = get_user_timezone()
+        start, end = _day_bounds(datetime.datetime.now(tz).date(), tz)
+        timed_events = []
+        for calendar_id in calendar_ids or CALENDAR_IDS:
+            events, _, time_zone = list_events(
+                service, calendar_id, timeMin=start.isoformat(), timeMax=end.isoformat(), orderBy="startTime"
+            )
+            events = [event for event in events if event.get("status") != "cancelled"]
+            timed_events.extend(_with_times(events, _resolve_timezone(time_zone)))
+        timed_events.sort(key=lambda timed: timed[1])
+        return [_format_event(event) for event, _, _ in timed_events]
 
     except HttpError as error:
         print(f"An error occurred: {error}")
-        return []
\ No newline at end of file
+        return None
@@ -0,0 +1,109 @@
+import json
+import os
+import sqlite3
+import threading
+from user_stores import UserStores, store_path
+
+STORE_FILE = store_path("calendar.sqlite3")
+
+class EventStore:
+    """
+    Local copy of the synced calendars plus their sync state.
+
+    Holds every event instance of each synced calendar keyed by (calendar ID,
+    event ID), indexed by start and end time so date-range queries never need
+    the API, and each calendar's `nextSyncToken` and time zone.
+    """
+
+    def __init__(self, path=STORE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS calendars (
+                calendar_id TEXT PRIMARY KEY,
+                sync_token TEXT,
+                time_zone TEXT
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS events (
+                calendar_id TEXT NOT NULL,
+                event_id TEXT NOT NULL,
+                start_ms INTEGER NOT NULL,
+                end_ms INTEGER NOT NULL,
+                event TEXT NOT NULL,
+                PRIMARY KEY (calendar_id, event_id)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS events_start ON events (start_ms)")
+        self._conn.commit()
+
+    def get_sync_state(self, calendar_id):
+        """Returns (sync_token, time_zone) for `calendar_id`; both are None if it was never synced."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT sync_token, time_zone FROM calendars WHERE calendar_id = ?", (calendar_id,)
+            ).fetchone()
+        return row if row else (None, None)
+
+    def set_sync_state(self, calendar_id, sync_token, time_zone=None):
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO calendars VALUES (?, ?, ?)
+                   ON CONFLICT(calendar_id) DO UPDATE SET
+                   sync_token = excluded.sync_token, time_zone = COALESCE(excluded.time_zone, time_zone)""",
+                (calendar_id, sync_token, time_zone),
+            )
+            self._conn.commit()
+
+    def put_events(self, calendar_id, events):
+        """Stores `events` as (event, start_ms, end_ms) tuples."""
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?)",
+                [(calendar_id, event["id"], start_ms, end_ms, json.dumps(event)) for event, start_ms, end_ms in events],
+            )
+            self._conn.commit()
+
+    def delete_events(self, calendar_id, event_ids):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM events WHERE calendar_id = ? AND event_id = ?", [(calendar_id, i) for i in event_ids]
+            )
+            self._conn.commit()
+
+    def prune_before(self, end_ms):
+        """Drops events that ended before `end_ms` (epoch milliseconds)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM events WHERE end_ms < ?", (end_ms,))
+            self._conn.commit()
+
+    def replace_calendar(self, calendar_id, events, sync_token, time_zone=None):
+        """Replaces a calendar's stored events with the result of a full sync."""
+        with self._lock:
+            self._conn.execute("DELETE FROM events WHERE calendar_id = ?", (calendar_id,))
+            self._conn.commit()
+        self.put_events(calendar_id, events)
+        self.set_sync_state(calendar_id, sync_token, time_zone)
+
+    def get_events(self, start_ms, end_ms, calendar_ids=None):
+        """Returns stored events overlapping [start_ms, end_ms), ordered by start time."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT calendar_id, event FROM events WHERE start_ms < ? AND end_ms > ? ORDER BY start_ms",
+                (end_ms, start_ms),
+            ).fetchall()
+        return [
+            json.loads(event) for calendar_id, event in rows
+            if calendar_ids is None or calendar_id in calendar_ids
+        ]
+
+_stores = UserStores(EventStore, "calendar.sqlite3")
+
+def get_event_store(user_id=None):
+    """Returns the process-wide calendar event store for `user_id` (or the default user), or None if it cannot be opened."""
+    return _stores.get(user_id)
@@ -1,16 +1,142 @@
 import json
 import logging
+import os
+import re
+import threading
+import time
 
 CONTEXT_FILE = "context.json"
+# Additional user profiles live in CONTEXT_DIR/<user_id>.json; the default
+# profile (no user ID) is CONTEXT_FILE.
+CONTEXT_DIR = os.getenv("FRIDAY_CONTEXT_DIR", "contexts")
+# How often a cached profile's file is stat()ed for changes when no watcher runs.
+CHECK_INTERVAL_SECONDS = float(os.getenv("CONTEXT_CHECK_INTERVAL_SECONDS", "1.0"))
 
-def get_user_context():
-    """Reads the user context from the context.json file."""
-    try:
-        with open(CONTEXT_FILE, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        logging.warning(f"{CONTEXT_FILE} not found. Using default empty context.")
-        return {}
-    except json.JSONDecodeError:
-        logging.error(f"Error decoding JSON from {CONTEXT_FILE}. Please check its format.")
-        return {}
\ No newline at end of file
+_USER_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.@-]+$")
+
+def validate_user_id(user_id):
+    """Raises ValueError unless `user_id` is safe to use in a file name."""
+    if not _USER_ID_PATTERN.match(user_id) or ".." in user_id:
+        raise ValueError(f"Invalid user ID: {user_id!r}")
+    return user_id
+
+class ContextProvider:
+    """
+    Cached, hot-reloading access to user context profiles.
+
+    Each profile is parsed once and kept in memory. Its file is re-read only when
+    its mtime or size changes, checked at most every `check_interval` seconds (or
+    only by the background watcher, once started). Subscribers are notified with
+    (user_id, context) whenever a loaded profile changes. A profile whose file
+    does not exist is served as empty and not cached.
+    """
+
+    def __init__(self, check_interval=CHECK_INTERVAL_SECONDS):
+        self.check_interval = check_interval
+        self._profiles = {}  # user_id -> {"path", "signature", "context", "checked_at"}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+
+    def _path_for(self, user_id):
+        if user_id is None:
+            return CONTEXT_FILE
+        return os.path.join(CONTEXT_DIR, f"{validate_user_id(user_id)}.json")
+
+    @staticmethod
+    def _signature(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    def _load(path):
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            logging.warning(f"{path} not found. Using default empty context.")
+            return {}
+        except json.JSONDecodeError:
+            logging.error(f"Error decoding JSON from {path}. Please check its format.")
+            return {}
+
+    def _refresh(self, user_id, profile=None):
+        """Reloads a profile if its file changed. Returns the current context."""
+        path = profile["path"] if profile else self._path_for(user_id)
+        signature = self._signature(path)
+        if profile is not None and profile["signature"] == signature:
+            profile["checked_at"] = time.monotonic()
+            return profile["context"]
+
+        context = self._load(path)
+        with self._lock:
+            if signature is None:
+                # A missing profile is not cached, so arbitrary user IDs are never kept (or watched).
+                self._profiles.pop(user_id, None)
+            else:
+                self._profiles[user_id] = {
+                    "path": path, "signature": signature, "context": context, "checked_at": time.monotonic(),
+                }
+            listeners = list(self._listeners)
+        if profile is not None:
+            logging.info(f"Context for {user_id or 'default user'} changed; reloaded {path}.")
+            for listener in listeners:
+                try:
+                    listener(user_id, context)
+                except Exception as e:
+                    logging.error(f"Context change listener failed: {e}")
+        return context
+
+    def get(self, user_id=None):
+        profile = self._profiles.get(user_id)
+        if profile is not None:
+            watched = self._watcher is not None
+            if watched or time.monotonic() - profile["checked_at"] < self.check_interval:
+                return dict(profile["context"])
+        return dict(self._refresh(user_id, profile))
+
+    def subscribe(self, listener):
+        """Registers `listener(user_id, context)` to be called when a loaded profile changes."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def start_watching(self, interval=CHECK_INTERVAL_SECONDS):
+        """Starts a background thread that polls loaded profiles for changes."""
+        if self._watcher is not None:
+            return
+        self._stop.clear()
+
+        def _watch():
+            while not self._stop.wait(interval):
+                for user_id, profile in list(self._profiles.items()):
+                    self._refresh(user_id, profile)
+
+        self._watcher = threading.Thread(target=_watch, name="context-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self, timeout=5):
+        """Stops the watcher thread; profiles are then checked on access again."""
+        watcher, self._watcher = self._watcher, None
+        self._stop.set()
+        if watcher is not None:
+            watcher.join(timeout)
+
+_provider = ContextProvider()
+
+def get_user_context(user_id=None):
+    """Returns the user context (the default profile, or `user_id`'s), served from cache."""
+    return _provider.get(user_id)
+
+def subscribe(listener):
+    """Registers `listener(user_id, context)` for context changes."""
+    _provider.subscribe(listener)
+
+def start_watching(interval=CHECK_INTERVAL_SECONDS):
+    _provider.start_watching(interval)
+
+def stop_watching():
+    _provider.stop_watching()
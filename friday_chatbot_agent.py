@@ -1,51 +1,102 @@
+import datetime
+import hashlib
 import logging
 import os
-import google.generativeai as genai
-from dotenv import load_dotenv
-from context_manager import get_user_context # Import the context manager
+import threading
+import time
+from context_manager import get_user_context, subscribe as subscribe_to_context # Import the context manager
+from session_store import create_session_store
+from llm_client import genai, get_client, lazy_client, MODEL_NAME
+from singleflight import SingleFlight
 
 # --- Configuration ---
-load_dotenv()
-
-try:
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY not found in .env file.")
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    logging.info("Gemini API configured successfully.")
-except Exception as e:
-    logging.error(f"Error configuring Gemini API: {e}")
-    model = None
-
-# In-memory session storage
-SESSIONS = {}
-
-def get_friday_response(user_message, session_id):
-    """
-    Generates a response using the live Gemini API, enriched with user context.
-    """
-    if not model:
-        return {"response": "Error: The Gemini API is not configured."}
+model = lazy_client("friday_chatbot")
+
+# Session storage (bounded, evicting; optionally persistent)
+SESSIONS = create_session_store()
+
+# Only the most recent turns are replayed to Gemini. Older turns are either
+# dropped or, with summarization enabled, folded into a rolling summary once
+# SUMMARY_BATCH_TURNS of them have accumulated, so per-turn tokens stay flat.
+HISTORY_WINDOW_TURNS = int(os.getenv("CHAT_HISTORY_WINDOW_TURNS", "10"))
+SUMMARIZE_HISTORY = os.getenv("CHAT_SUMMARIZE_HISTORY", "true").lower() == "true"
+SUMMARY_BATCH_TURNS = int(os.getenv("CHAT_SUMMARY_BATCH_TURNS", "4"))
+
+# The persona and user context are sent as a system instruction instead of
+# inside every user message. Chat models are cached per instruction and,
+# optionally, backed by Gemini context caching (which needs a pinned model
+# version and a large enough prompt to be accepted).
+CONTEXT_CACHING = os.getenv("CHAT_CONTEXT_CACHING", "false").lower() == "true"
+CONTEXT_CACHE_MODEL = os.getenv("CHAT_CONTEXT_CACHE_MODEL", "models/gemini-1.5-flash-001")
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CHAT_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+# A model backed by cached content is rebuilt this long before the cache
+# expires on Gemini's side, so no turn is sent against an expired cache.
+CONTEXT_CACHE_REFRESH_MARGIN_SECONDS = min(300, CONTEXT_CACHE_TTL_SECONDS // 10)
+_chat_models = {}  # instruction hash -> (model, expires_at or None)
+_chat_models_lock = threading.Lock()
+_chat_models_generation = 0
+_chat_model_flight = SingleFlight()
 
-    if session_id not in SESSIONS:
-        SESSIONS[session_id] = {"history": []}
-    
-    session = SESSIONS[session_id]
-    
+def _session_key(session_id, user_id=None):
+    """Sessions are namespaced per user, so two users can never share a session ID."""
+    return session_id if user_id is None else f"{user_id}:{session_id}"
+
+def _get_session(session_id):
+    session = SESSIONS.get(session_id)
+    if session is None:
+        session = {"history": [], "summary": ""}
+    return session
+
+def _to_gemini_history(session):
     gemini_history = []
+    if session.get("summary"):
+        gemini_history.append({'role': 'user', 'parts': [f"Summary of our earlier conversation: {session['summary']}"]})
+        gemini_history.append({'role': 'model', 'parts': ["Understood."]})
     for message in session["history"]:
         gemini_history.append({'role': message['role'], 'parts': message['parts']})
+    return gemini_history
 
-    # Fetch the user's global context
-    user_context = get_user_context()
+def _summarize(summary, messages):
+    """Folds `messages` into the rolling conversation summary."""
+    transcript = "\n".join(f"{m['role']}: {' '.join(m['parts'])}" for m in messages)
+    prompt = f"""
+        Update the running summary of a conversation between a Google employee ("user") and FRIDAY ("model").
+        Keep the facts, decisions, and the current step of any workflow in progress. Respond with the summary only, in at most 150 words.
+
+        Current summary: {summary or "(none)"}
+
+        New messages:
+        {transcript}
+        """
+    return model.generate_content(prompt).text.strip()
 
+def _trim_history(session):
+    history = session["history"]
+    window = HISTORY_WINDOW_TURNS * 2
+    overflow = len(history) - window
+    if overflow <= 0:
+        return
+    if not SUMMARIZE_HISTORY:
+        session["history"] = history[-window:]
+        return
+    if overflow < SUMMARY_BATCH_TURNS * 2:
+        return
     try:
-        chat = model.start_chat(history=gemini_history)
-        
-        # The prompt is now enriched with the user's details
-        prompt = f"""
-        You are FRIDAY, an expert AI assistant for Google employees. Your primary goal is to provide clear, step-by-step guidance for internal Google processes.
+        session["summary"] = _summarize(session.get("summary", ""), history[:overflow])
+    except Exception as e:
+        logging.error(f"Could not summarize chat history, dropping older turns instead: {e}")
+    session["history"] = history[overflow:]
+
+def _commit_turn(session_id, session, user_message, bot_message):
+    session["history"].append({"role": "user", "parts": [user_message]})
+    session["history"].append({"role": "model", "parts": [bot_message]})
+    _trim_history(session)
+    SESSIONS.save(session_id, session)
+
+def _build_system_instruction(user_context):
+    """Builds the persona, guidance and user context once, as a system instruction."""
+    return f"""
+You are FRIDAY, an expert AI assistant for Google employees. Your primary goal is to provide clear, step-by-step guidance for internal Google processes.
 
 **User Context:**
 You have access to the following information about the user:
@@ -62,12 +113,8 @@ You have access to the following information about the user:
 5.  **Direct & Concise:** Avoid conversational fillers. Get straight to the point and use simple language.
 6.  **No Hallucinations:** Only provide information that you are certain is accurate based on internal Google documentation and processes. If you are unsure, state that you need more information or cannot help with that specific task.
 
-**Input:**
-- **Conversation History:** [A log of previous messages to understand the current context of the workflow.]
-- **User's Latest Message:** {user_message}
-
 **Task:**
-Based on the **User's Latest Message** and the **Conversation History**, analyze the user's intent. Then, determine and provide the **next single, actionable step** for the user to take.
+Each user turn is the user's latest message. Based on it and the conversation so far, analyze the user's intent. Then, determine and provide the **next single, actionable step** for the user to take, or a clarifying question.
 
 **Formatting:**
 * Start your response directly with the actionable step or clarifying question.
@@ -91,23 +138,166 @@ Based on the **User's Latest Message** and the **Conversation History**, analyze
 * **Conversation History:** ["Okay, I've run the `gcert` command."]
 * **User's Latest Message:** "What's next?"
 * **Response:** Now, you need to **log into** your device with your new credentials.
+"""
 
----
+def _create_chat_model(system_instruction):
+    """
+    Returns (model, expires_at): expires_at is the time.monotonic() deadline
+    after which a model backed by cached content must be rebuilt, or None.
+    """
+    if CONTEXT_CACHING:
+        try:
+            cached_content = genai().caching.CachedContent.create(
+                model=CONTEXT_CACHE_MODEL,
+                system_instruction=system_instruction,
+                ttl=datetime.timedelta(seconds=CONTEXT_CACHE_TTL_SECONDS),
+            )
+            expires_at = time.monotonic() + CONTEXT_CACHE_TTL_SECONDS - CONTEXT_CACHE_REFRESH_MARGIN_SECONDS
+            return get_client("friday_chatbot", model=genai().GenerativeModel.from_cached_content(cached_content)), expires_at
+        except Exception as e:
+            # Context caching has a minimum prompt size and is only available on
+            # some model versions; a plain system instruction still works everywhere.
+            logging.warning(f"Context caching unavailable, using a plain system instruction: {e}")
+    return get_client("friday_chatbot", model_name=MODEL_NAME, system_instruction=system_instruction), None
 
-**Current Task:**
-Analyze the user's latest message: "{user_message}".
-Based on this, what is the single next action or clarifying question?
-        """
+def _build_chat_model(key, system_instruction):
+    with _chat_models_lock:
+        generation = _chat_models_generation
+    # Created outside the lock: CachedContent.create is a network call, and other
+    # users' models must stay available while it runs.
+    chat_model, expires_at = _create_chat_model(system_instruction)
+    with _chat_models_lock:
+        # A context change while creating means this instruction may already be stale.
+        if chat_model is not None and generation == _chat_models_generation:
+            _chat_models[key] = (chat_model, expires_at)
+    return chat_model
+
+def _get_chat_model(user_context):
+    """
+    Returns a model whose system instruction carries the persona and user context.
+
+    Models are shared by every session with the same instruction, so the
+    instruction is built once rather than on every turn. Models backed by
+    cached content are rebuilt shortly before the cache expires.
+    """
+    system_instruction = _build_system_instruction(user_context)
+    key = hashlib.sha256(system_instruction.encode("utf-8")).hexdigest()
+    with _chat_models_lock:
+        entry = _chat_models.get(key)
+        if entry is not None and (entry[1] is None or time.monotonic() < entry[1]):
+            return entry[0]
+    return _chat_model_flight.do(key, _build_chat_model, key, system_instruction)
+
+def _invalidate_chat_models(*_):
+    """Drops chat models built from a previous version of the user context."""
+    global _chat_models_generation
+    with _chat_models_lock:
+        _chat_models.clear()
+        _chat_models_generation += 1
+
+subscribe_to_context(_invalidate_chat_models)
+
+def _record_usage(session, response, started, first_token_at=None):
+    """Adds a turn's token counts and latency to the session's usage report."""
+    usage = session.setdefault("usage", {
+        "turns": 0, "prompt_tokens": 0, "response_tokens": 0, "total_tokens": 0,
+        "last_prompt_tokens": 0, "last_time_to_first_token_ms": None, "last_latency_ms": None,
+    })
+    metadata = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(metadata, "prompt_token_count", 0) or 0
+    response_tokens = getattr(metadata, "candidates_token_count", 0) or 0
+    usage["turns"] += 1
+    usage["prompt_tokens"] += prompt_tokens
+    usage["response_tokens"] += response_tokens
+    usage["total_tokens"] += prompt_tokens + response_tokens
+    usage["last_prompt_tokens"] = prompt_tokens
+    now = time.perf_counter()
+    usage["last_latency_ms"] = round((now - started) * 1000, 1)
+    usage["last_time_to_first_token_ms"] = round(((first_token_at or now) - started) * 1000, 1)
+
+def get_session_usage(session_id, user_id=None):
+    """Returns the token-accounting report for a session, or None if the session does not exist."""
+    session = SESSIONS.get(_session_key(session_id, user_id))
+    if session is None:
+        return None
+    usage = dict(session.get("usage", {}))
+    if usage.get("turns"):
+        usage["avg_prompt_tokens_per_turn"] = round(usage["prompt_tokens"] / usage["turns"], 1)
+    usage["history_messages"] = len(session["history"])
+    usage["has_summary"] = bool(session.get("summary"))
+    return usage
+
+def get_friday_response(user_message, session_id, user_id=None):
+    """
+    Generates a response using the live Gemini API, enriched with user context
+    (the default user's, or `user_id`'s).
+    """
+    if not model:
+        return {"response": "Error: The Gemini API is not configured."}
+
+    session_id = _session_key(session_id, user_id)
+    session = _get_session(session_id)
+
+    # Fetch the user's global context
+    user_context = get_user_context(user_id)
+
+    try:
+        chat = _get_chat_model(user_context).start_chat(history=_to_gemini_history(session))
         
-        logging.info(f"Sending enriched prompt to Gemini for session {session_id}...")
-        response = chat.send_message(prompt)
+        logging.info(f"Sending message to Gemini for session {session_id}...")
+        started = time.perf_counter()
+        response = chat.send_message(user_message)
         bot_message = response.text
+        _record_usage(session, response, started)
         
-        session["history"].append({"role": "user", "parts": [user_message]})
-        session["history"].append({"role": "model", "parts": [bot_message]})
+        _commit_turn(session_id, session, user_message, bot_message)
         
         return {"response": bot_message}
 
     except Exception as e:
         logging.error(f"Error calling Gemini API: {e}")
-        return {"response": f"An error occurred while contacting the Gemini API: {e}"}
\ No newline at end of file
+        return {"response": f"An error occurred while contacting the Gemini API: {e}"}
+
+def stream_friday_response(user_message, session_id, user_id=None):
+    """
+    Streaming variant of get_friday_response.
+
+    Yields ("token", text) for each chunk as Gemini produces it, then a final
+    ("done", full_response) or ("error", message). The turn is committed to the
+    session history only once the full response has been received.
+    """
+    if not model:
+        yield "error", "Error: The Gemini API is not configured."
+        return
+
+    session_id = _session_key(session_id, user_id)
+    session = _get_session(session_id)
+    user_context = get_user_context(user_id)
+
+    try:
+        chat = _get_chat_model(user_context).start_chat(history=_to_gemini_history(session))
+
+        logging.info(f"Streaming message to Gemini for session {session_id}...")
+        started = time.perf_counter()
+        first_token_at = None
+        chunks = []
+        response = chat.send_message(user_message, stream=True)
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                continue  # Chunks without text parts (e.g. the final finish_reason chunk).
+            if text:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                chunks.append(text)
+                yield "token", text
+
+        bot_message = "".join(chunks)
+        _record_usage(session, response, started, first_token_at)
+        _commit_turn(session_id, session, user_message, bot_message)
+        yield "done", bot_message
+
+    except Exception as e:
+        logging.error(f"Error streaming from Gemini API: {e}")
+        yield "error", f"An error occurred while contacting the Gemini API: {e}"
@@ -1,24 +1,231 @@
 from googleapiclient.errors import HttpError
-from auth import get_gmail_service
+from auth import get_gmail_service, http_status
+from gmail.store import get_mailbox_store
+from metrics import span
+from singleflight import SingleFlight
 import datetime
+import time
 
-def get_todays_emails(service):
-    """Gets all unread emails from today."""
+# Gmail accepts at most 100 calls per batch request, but recommends staying
+# well below that to avoid per-user rate limiting.
+MAX_BATCH_SIZE = 100
+DEFAULT_BATCH_SIZE = 50
+
+# Only the pieces of a message the agents actually read: IDs, labels, the
+# headers we classify on and the (possibly nested) MIME parts with their data.
+MESSAGE_FIELDS = (
+    "id,threadId,labelIds,internalDate,historyId,snippet,"
+    "payload(mimeType,headers,body/data,"
+    "parts(mimeType,headers,body/data,parts(mimeType,headers,body/data,parts)))"
+)
+
+# Messages that fail inside a batch (typically 429 rateLimitExceeded) are
+# retried this many times, after an exponentially growing pause.
+FETCH_RETRIES = 2
+FETCH_RETRY_BACKOFF_SECONDS = 1.0
+
+# Messages carrying any of these labels are not part of the inbox view.
+EXCLUDED_LABELS = {"DRAFT", "SPAM", "TRASH"}
+HISTORY_TYPES = ["messageAdded", "messageDeleted", "labelAdded", "labelRemoved"]
+
+_DEFAULT = object()
+
+# Concurrent syncs of the same mailbox store (e.g. several dashboards loading at
+# once) share one run; each caller then reads today's messages from the store.
+sync_flight = SingleFlight()
+
+def list_message_ids(service, query, page_size=100):
+    """Lists the IDs of every message matching `query`, following nextPageToken."""
+    message_ids = []
+    page_token = None
+    while True:
+        request_kwargs = {"userId": "me", "q": query, "maxResults": page_size}
+        if page_token:
+            request_kwargs["pageToken"] = page_token
+        with span("gmail.list"):
+            results = service.users().messages().list(**request_kwargs).execute()
+        message_ids.extend(message["id"] for message in results.get("messages", []))
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            return message_ids
+
+def fetch_messages(service, message_ids, batch_size=DEFAULT_BATCH_SIZE, format="full",
+                   fields=MESSAGE_FIELDS, batch_factory=None):
+    """
+    Fetches the given messages using Gmail batch HTTP requests.
+
+    Messages are fetched in chunks of `batch_size` (capped at the API limit), so
+    N messages cost ceil(N / batch_size) round trips instead of N. `batch_factory`
+    defaults to `service.new_batch_http_request` and can be swapped for a fake
+    transport in tests. Results are returned in the order of `message_ids`;
+    messages that still failed to fetch after FETCH_RETRIES retries are skipped.
+    """
+    return _fetch_messages(service, message_ids, batch_size, format, fields, batch_factory)[0]
+
+def _fetch_messages(service, message_ids, batch_size=DEFAULT_BATCH_SIZE, format="full",
+                    fields=MESSAGE_FIELDS, batch_factory=None):
+    """Like fetch_messages, but returns (messages, IDs that could not be fetched)."""
+    if batch_factory is None:
+        batch_factory = service.new_batch_http_request
+    batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+
+    fetched = {}
+    failed = []
+
+    def _on_message(request_id, response, exception):
+        if exception is None:
+            fetched[request_id] = response
+        elif http_status(exception) == 404:
+            print(f"Message {request_id} no longer exists; skipping it.")
+        else:
+            print(f"An error occurred fetching message {request_id}: {exception}")
+            failed.append(request_id)
+
+    remaining = list(message_ids)
+    for attempt in range(FETCH_RETRIES + 1):
+        if attempt:
+            time.sleep(FETCH_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            print(f"Retrying {len(remaining)} messages that failed to fetch.")
+        failed.clear()
+        for start in range(0, len(remaining), batch_size):
+            batch = batch_factory(callback=_on_message)
+            for message_id in remaining[start:start + batch_size]:
+                request_kwargs = {"userId": "me", "id": message_id, "format": format}
+                if fields:
+                    request_kwargs["fields"] = fields
+                batch.add(service.users().messages().get(**request_kwargs), request_id=message_id)
+            with span("gmail.get"):
+                batch.execute()
+        remaining = list(failed)
+        if not remaining:
+            break
+
+    return [fetched[message_id] for message_id in message_ids if message_id in fetched], remaining
+
+def _today_query():
     today = datetime.date.today()
-    query = f"is:unread after:{today.strftime('%Y/%m/%d')}"
-    try:
-        results = service.users().messages().list(userId="me", q=query).execute()
-        messages = results.get("messages", [])
-        
-        emails = []
-        if not messages:
+    return f"is:unread after:{today.strftime('%Y/%m/%d')}"
+
+def _start_of_today_ms():
+    midnight = datetime.datetime.combine(datetime.date.today(), datetime.time.min)
+    return int(midnight.timestamp() * 1000)
+
+def full_sync(service, store, batch_size=DEFAULT_BATCH_SIZE, format="full", fields=MESSAGE_FIELDS,
+              batch_factory=None):
+    """
+    Re-downloads today's unread messages and records the mailbox historyId.
+
+    The historyId is read before listing, so changes that land while the full
+    sync runs are picked up (again) by the next incremental sync. Messages that
+    could not be downloaded are recorded as pending and retried by the next sync.
+    """
+    history_id = service.users().getProfile(userId="me").execute()["historyId"]
+    message_ids = list_message_ids(service, _today_query())
+    messages, failed = _fetch_messages(service, message_ids, batch_size=batch_size, format=format,
+                                       fields=fields, batch_factory=batch_factory)
+    store.replace_all(messages, history_id, pending=failed)
+    print(f"Full mailbox sync fetched {len(messages)} messages.")
+    return messages
+
+def incremental_sync(service, store, batch_size=DEFAULT_BATCH_SIZE, format="full", fields=MESSAGE_FIELDS,
+                     batch_factory=None):
+    """
+    Applies the changes since the stored historyId using users.history.list.
+
+    Only messages added since the last sync (plus those a previous sync failed
+    to download) are fetched; label changes and deletions are applied to the
+    stored copies. Messages that still fail are kept pending, since the
+    historyId moves past them. Raises HttpError (404) if the stored historyId
+    has expired.
+    """
+    start_history_id = store.get_history_id()
+    to_fetch = []
+    deleted = set()
+    latest_history_id = start_history_id
+    page_token = None
+    while True:
+        request_kwargs = {"userId": "me", "startHistoryId": start_history_id, "historyTypes": HISTORY_TYPES}
+        if page_token:
+            request_kwargs["pageToken"] = page_token
+        with span("gmail.history"):
+            results = service.users().history().list(**request_kwargs).execute()
+        for record in results.get("history", []):
+            for added in record.get("messagesAdded", []):
+                labels = added["message"].get("labelIds", [])
+                if "UNREAD" in labels and not EXCLUDED_LABELS.intersection(labels):
+                    to_fetch.append(added["message"]["id"])
+            for removed in record.get("messagesDeleted", []):
+                deleted.add(removed["message"]["id"])
+            for change in record.get("labelsAdded", []):
+                message_id = change["message"]["id"]
+                if not store.update_labels(message_id, added=change.get("labelIds", [])) and "UNREAD" in change.get("labelIds", []):
+                    to_fetch.append(message_id)
+                if EXCLUDED_LABELS.intersection(change.get("labelIds", [])):
+                    deleted.add(message_id)
+            for change in record.get("labelsRemoved", []):
+                store.update_labels(change["message"]["id"], removed=change.get("labelIds", []))
+        latest_history_id = results.get("historyId", latest_history_id)
+        page_token = results.get("nextPageToken")
+        if not page_token:
+            break
+
+    to_fetch = list(dict.fromkeys(i for i in [*store.get_pending(), *to_fetch] if i not in deleted))
+    messages, failed = _fetch_messages(service, to_fetch, batch_size=batch_size, format=format,
+                                       fields=fields, batch_factory=batch_factory)
+    store.put_messages(messages)
+    store.delete_messages(deleted)
+    store.prune_before(_start_of_today_ms())
+    store.set_pending(failed)
+    store.set_history_id(latest_history_id)
+    print(f"Incremental mailbox sync fetched {len(messages)} new messages.")
+    return messages
+
+def sync_inbox(service, store, **fetch_kwargs):
+    """Brings the local mailbox store up to date, falling back to a full sync when needed."""
+    if store.get_history_id():
+        try:
+            return incremental_sync(service, store, **fetch_kwargs)
+        except HttpError as error:
+            # Gmail reports an expired historyId as 404 Not Found.
+            if http_status(error) != 404:
+                raise
+            print("Stored historyId has expired; falling back to a full sync.")
+    return full_sync(service, store, **fetch_kwargs)
+
+def get_todays_emails(service, batch_size=DEFAULT_BATCH_SIZE, format="full", fields=MESSAGE_FIELDS,
+                      batch_factory=None, store=_DEFAULT):
+    """
+    Gets all unread emails from today.
+
+    By default the shared mailbox store is synced incrementally via the Gmail
+    history API and today's unread messages are served from it (as last synced,
+    if the sync fails); pass `store=None` to always query and download the full set.
+    Returns None if the messages could not be fetched at all.
+    """
+    if store is _DEFAULT:
+        store = get_mailbox_store()
+    fetch_kwargs = {"batch_size": batch_size, "format": format, "fields": fields, "batch_factory": batch_factory}
+    if store is not None:
+        try:
+            sync_flight.do(store, sync_inbox, service, store, **fetch_kwargs)
+        except HttpError as error:
+            if not store.get_history_id():
+                print(f"An error occurred: {error}")
+                return None  # Never synced, so there is nothing to fall back on.
+            # Serve what the store already holds rather than an empty inbox.
+            print(f"An error occurred syncing the mailbox, serving stored messages: {error}")
+        emails = store.get_messages(since_ms=_start_of_today_ms(), label="UNREAD")
+        if not emails:
             print("No new messages found.")
-        else:
-            for message in messages:
-                msg = service.users().messages().get(userId="me", id=message["id"]).execute()
-                emails.append(msg)
         return emails
 
+    try:
+        message_ids = list_message_ids(service, _today_query())
+        if not message_ids:
+            print("No new messages found.")
+            return []
+        return fetch_messages(service, message_ids, **fetch_kwargs)
+
     except HttpError as error:
         print(f"An error occurred: {error}")
-        return []
\ No newline at end of file
+        return None
@@ -0,0 +1,120 @@
+import json
+import os
+import sqlite3
+import threading
+from user_stores import UserStores, store_path
+
+STORE_FILE = store_path("mailbox.sqlite3")
+
+class MailboxStore:
+    """
+    Local copy of the synced slice of the mailbox plus its sync state.
+
+    Holds the full Gmail message resources fetched so far, keyed by message ID,
+    and the `historyId` the copy is current as of, so later syncs only need the
+    changes since then.
+    """
+
+    def __init__(self, path=STORE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)")
+        # Messages a sync learned about but could not download; the next sync retries them.
+        self._conn.execute("CREATE TABLE IF NOT EXISTS pending (id TEXT PRIMARY KEY)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS messages (
+                id TEXT PRIMARY KEY,
+                internal_date INTEGER NOT NULL,
+                label_ids TEXT NOT NULL,
+                message TEXT NOT NULL
+            )"""
+        )
+        self._conn.commit()
+
+    def get_history_id(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM sync_state WHERE key = 'history_id'").fetchone()
+        return row[0] if row else None
+
+    def set_history_id(self, history_id):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO sync_state VALUES ('history_id', ?)", (str(history_id),))
+            self._conn.commit()
+
+    def get_pending(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT id FROM pending")]
+
+    def set_pending(self, message_ids):
+        """Replaces the IDs of messages still waiting to be downloaded."""
+        with self._lock:
+            self._conn.execute("DELETE FROM pending")
+            self._conn.executemany("INSERT OR IGNORE INTO pending VALUES (?)", [(i,) for i in message_ids])
+            self._conn.commit()
+
+    def put_messages(self, messages):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?)",
+                [
+                    (m["id"], int(m.get("internalDate", 0)), json.dumps(m.get("labelIds", [])), json.dumps(m))
+                    for m in messages
+                ],
+            )
+            self._conn.commit()
+
+    def update_labels(self, message_id, added=(), removed=()):
+        """Applies a label change to a stored message. Returns False if it is not stored."""
+        with self._lock:
+            row = self._conn.execute("SELECT message FROM messages WHERE id = ?", (message_id,)).fetchone()
+            if not row:
+                return False
+            message = json.loads(row[0])
+            labels = [label for label in message.get("labelIds", []) if label not in removed]
+            labels.extend(label for label in added if label not in labels)
+            message["labelIds"] = labels
+            self._conn.execute(
+                "UPDATE messages SET label_ids = ?, message = ? WHERE id = ?",
+                (json.dumps(labels), json.dumps(message), message_id),
+            )
+            self._conn.commit()
+            return True
+
+    def delete_messages(self, message_ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM messages WHERE id = ?", [(i,) for i in message_ids])
+            self._conn.commit()
+
+    def prune_before(self, internal_date_ms):
+        """Drops messages received before `internal_date_ms` (epoch milliseconds)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE internal_date < ?", (internal_date_ms,))
+            self._conn.commit()
+
+    def replace_all(self, messages, history_id, pending=()):
+        """Replaces the stored mailbox with the result of a full sync."""
+        with self._lock:
+            self._conn.execute("DELETE FROM messages")
+            self._conn.commit()
+        self.put_messages(messages)
+        self.set_pending(pending)
+        self.set_history_id(history_id)
+
+    def get_messages(self, since_ms=0, label=None):
+        """Returns stored messages received at or after `since_ms`, newest first, optionally filtered by label."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT label_ids, message FROM messages WHERE internal_date >= ? ORDER BY internal_date DESC",
+                (since_ms,),
+            ).fetchall()
+        return [json.loads(message) for label_ids, message in rows if label is None or label in json.loads(label_ids)]
+
+_stores = UserStores(MailboxStore, "mailbox.sqlite3")
+
+def get_mailbox_store(user_id=None):
+    """Returns the process-wide mailbox store for `user_id` (or the default user), or None if it cannot be opened."""
+    return _stores.get(user_id)
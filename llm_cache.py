@@ -0,0 +1,162 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from singleflight import SingleFlight
+from state_backend import get_state_backend, run_once
+
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512"))
+CACHE_DISK = os.getenv("LLM_CACHE_DISK", "true").lower() == "true"
+CACHE_FILE = os.path.join(os.getenv("FRIDAY_CACHE_DIR", ".friday_cache"), "llm_cache.sqlite3")
+# With the disk tier on, a miss also takes a lease on the shared state backend so
+# that other worker processes wait for its result instead of repeating the call.
+# The lease must outlast a call including its retries.
+CACHE_SHARED_LOCK_SECONDS = float(os.getenv("LLM_CACHE_SHARED_LOCK_SECONDS", "180"))
+
+class CachedResponse:
+    """Stands in for a Gemini response served from cache; exposes `.text` like the real one."""
+
+    usage_metadata = None
+
+    def __init__(self, text):
+        self.text = text
+
+def make_key(model_name, contents, **config):
+    """Content-addressed key: a hash of the model, the prompt and the generation config."""
+    payload = json.dumps({"model": model_name, "contents": contents, "config": config}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Two-tier cache of LLM response texts for deterministic prompts.
+
+    The memory tier is an LRU of at most `max_entries`; the optional disk tier
+    (SQLite) survives restarts and is shared by every worker process. Each entry
+    carries the TTL chosen by its call site. Concurrent misses for the same key
+    share one in-flight API call, within a process and, through `backend`
+    leases, across the workers sharing the disk tier.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, path=CACHE_FILE if CACHE_DISK else None, backend=None):
+        self.max_entries = max_entries
+        self.backend = backend
+        self._memory = OrderedDict()  # key -> (text, expires_at)
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self.hits = {}
+        self.misses = {}
+        self._conn = None
+        if path:
+            try:
+                if path != ":memory:":
+                    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                self._conn = sqlite3.connect(path, check_same_thread=False)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, text TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logging.error(f"Could not open LLM response cache at {path}, using memory only: {e}")
+                self._conn = None
+
+    def _get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    return entry[0]
+                del self._memory[key]
+            if self._conn is None:
+                return None
+            row = self._conn.execute("SELECT text, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] <= now:
+                return None
+            self._put_memory(key, row[0], row[1])
+            return row[0]
+
+    def _put_memory(self, key, text, expires_at):
+        self._memory[key] = (text, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _put(self, key, text, ttl_seconds):
+        expires_at = time.time() + ttl_seconds
+        with self._lock:
+            self._put_memory(key, text, expires_at)
+            if self._conn is not None:
+                self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (key, text, expires_at))
+                self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+                self._conn.commit()
+
+    def _count(self, counter, call_site):
+        with self._lock:
+            counter[call_site] = counter.get(call_site, 0) + 1
+
+    def get_or_generate(self, key, ttl_seconds, generate, call_site="default"):
+        """
+        Returns the cached response for `key`, or calls `generate()` once and caches its text.
+
+        Returns a real response on a miss and a CachedResponse on a hit.
+        """
+        text = self._get(key)
+        if text is not None:
+            self._count(self.hits, call_site)
+            return CachedResponse(text)
+
+        def _load():
+            cached_text = self._get(key)
+            return CachedResponse(cached_text) if cached_text is not None else None
+
+        def _generate():
+            cached = _load()  # Filled by a flight that finished just before this one started.
+            if cached is not None:
+                return cached
+            response = generate()
+            self._put(key, response.text, ttl_seconds)
+            return response
+
+        def _generate_once():
+            if self.backend is None or self._conn is None:
+                return _generate()
+            return run_once(self.backend, f"llm:{key}", _generate, _load, CACHE_SHARED_LOCK_SECONDS)
+
+        self._count(self.misses, call_site)
+        return self._flight.do(key, _generate_once)
+
+    def invalidate(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM responses")
+                self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": dict(self.hits),
+                "misses": dict(self.misses),
+                "memory_entries": len(self._memory),
+                "disk": self._conn is not None,
+                "single_flight": self._flight.stats(),
+            }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Returns the process-wide LLM response cache."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(backend=get_state_backend())
+    return _cache
@@ -0,0 +1,322 @@
+import logging
+import os
+import random
+import threading
+import time
+from dotenv import load_dotenv
+from llm_cache import get_response_cache, make_key
+from metrics import span
+
+# --- Configuration ---
+load_dotenv()
+
+MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "300"))
+TOKENS_PER_MINUTE = int(os.getenv("GEMINI_TOKENS_PER_MINUTE", "1000000"))
+MAX_CONCURRENT_REQUESTS = int(os.getenv("GEMINI_MAX_CONCURRENT_REQUESTS", "16"))
+REQUEST_TIMEOUT = float(os.getenv("GEMINI_REQUEST_TIMEOUT", "60"))
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+RETRY_BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "1.0"))
+CHARS_PER_TOKEN = 4
+# Output tokens are not known up front; reserve this many per request and
+# settle the difference once the response reports its actual usage.
+ESTIMATED_RESPONSE_TOKENS = 500
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_configured = None
+_configure_lock = threading.Lock()
+
+def genai():
+    """
+    Returns the google.generativeai module, importing it on first use.
+
+    The SDK (and the gRPC/protobuf stack behind it) is slow to import, so it is
+    kept off the import path of main.py and loaded by the first agent call.
+    """
+    import google.generativeai
+    return google.generativeai
+
+def configure():
+    """Configures the Gemini SDK once per process. Returns True if an API key is available."""
+    global _configured
+    if _configured is None:
+        with _configure_lock:
+            if _configured is None:
+                try:
+                    api_key = os.getenv("GEMINI_API_KEY")
+                    if not api_key:
+                        raise ValueError("GEMINI_API_KEY not found in .env file.")
+                    genai().configure(api_key=api_key)
+                    logging.info("Gemini API configured successfully.")
+                    _configured = True
+                except Exception as e:
+                    logging.error(f"Error configuring Gemini API: {e}")
+                    _configured = False
+    return _configured
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `rate_per_minute`.
+
+    `acquire` blocks until enough capacity is available. The balance may go
+    negative through `adjust`, which makes later callers wait off the debt.
+    """
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.rate_per_second = rate_per_minute / 60.0
+        self._available = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._available = min(self.capacity, self._available + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def acquire(self, amount=1.0):
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._available >= amount:
+                    self._available -= amount
+                    return
+                wait = (amount - self._available) / self.rate_per_second
+            time.sleep(min(wait, 1.0))
+
+    def adjust(self, amount):
+        """Charges (positive) or refunds (negative) `amount` without blocking."""
+        with self._lock:
+            self._refill()
+            self._available = min(self.capacity, self._available - amount)
+
+_request_bucket = TokenBucket(REQUESTS_PER_MINUTE)
+_token_bucket = TokenBucket(TOKENS_PER_MINUTE)
+_concurrency = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+
+# --- Metrics ---
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+def _record(agent, latency=None, prompt_tokens=0, response_tokens=0, error=None, retries=0):
+    with _metrics_lock:
+        m = _metrics.setdefault(agent, {
+            "requests": 0, "errors": 0, "retries": 0, "prompt_tokens": 0, "response_tokens": 0,
+            "latency_total_ms": 0.0, "latency_max_ms": 0.0, "last_error": None,
+        })
+        m["requests"] += 1
+        m["retries"] += retries
+        m["prompt_tokens"] += prompt_tokens
+        m["response_tokens"] += response_tokens
+        if latency is not None:
+            latency_ms = latency * 1000
+            m["latency_total_ms"] += latency_ms
+            m["latency_max_ms"] = max(m["latency_max_ms"], latency_ms)
+        if error is not None:
+            m["errors"] += 1
+            m["last_error"] = str(error)[:200]
+
+def get_metrics():
+    """Returns per-agent request, error, retry, token and latency counters."""
+    with _metrics_lock:
+        report = {}
+        for agent, m in _metrics.items():
+            report[agent] = dict(m)
+            report[agent]["latency_avg_ms"] = round(m["latency_total_ms"] / m["requests"], 1) if m["requests"] else 0.0
+            report[agent]["latency_total_ms"] = round(m["latency_total_ms"], 1)
+            report[agent]["latency_max_ms"] = round(m["latency_max_ms"], 1)
+        return report
+
+# --- Client ---
+def _is_retryable(error):
+    """Returns True for rate-limit and transient server errors."""
+    try:
+        from google.api_core import exceptions as google_exceptions
+    except ImportError:
+        google_exceptions = None
+    if google_exceptions is not None and isinstance(error, (
+        google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests,
+        google_exceptions.InternalServerError, google_exceptions.ServiceUnavailable,
+        google_exceptions.DeadlineExceeded,
+    )):
+        return True
+    return getattr(error, "code", None) in RETRYABLE_STATUS_CODES
+
+def _estimate_tokens(content):
+    if isinstance(content, str):
+        return len(content) // CHARS_PER_TOKEN + 1
+    return len(str(content)) // CHARS_PER_TOKEN + 1
+
+def _usage(response):
+    metadata = getattr(response, "usage_metadata", None)
+    return (getattr(metadata, "prompt_token_count", 0) or 0, getattr(metadata, "candidates_token_count", 0) or 0)
+
+class _StreamingResponse:
+    """Wraps a streamed response so metrics and token usage are recorded once it is exhausted."""
+
+    def __init__(self, response, on_complete):
+        self._response = response
+        self._on_complete = on_complete
+
+    def __iter__(self):
+        error = None
+        try:
+            yield from self._response
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._on_complete(self._response, error)
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+class LLMClient:
+    """
+    Gemini model wrapper shared by every agent.
+
+    All calls go through the process-wide request and token rate limiters and the
+    concurrency limit, get a request timeout, are retried with exponential backoff
+    on 429/5xx errors, and are recorded in per-agent metrics.
+    """
+
+    def __init__(self, agent, model=None, model_name=MODEL_NAME, **model_kwargs):
+        self.agent = agent
+        self.model = model if model is not None else genai().GenerativeModel(model_name, **model_kwargs)
+        # Identifies the model configuration in response-cache keys.
+        self.cache_namespace = {"model": getattr(self.model, "model_name", model_name), **model_kwargs}
+
+    def _call(self, func, content, stream=False, **kwargs):
+        kwargs.setdefault("request_options", {"timeout": REQUEST_TIMEOUT})
+        estimated_tokens = _estimate_tokens(content) + ESTIMATED_RESPONSE_TOKENS
+        attempt = 0
+        while True:
+            _request_bucket.acquire()
+            _token_bucket.acquire(estimated_tokens)
+            with _concurrency:
+                started = time.perf_counter()
+                try:
+                    with span("llm.call", agent=self.agent):
+                        response = func(content, stream=stream, **kwargs) if stream else func(content, **kwargs)
+                except Exception as e:
+                    error = e
+                else:
+                    error = None
+            # For streams the concurrency slot only covers opening the stream, so
+            # a caller that never finishes iterating cannot leak it.
+
+            if error is not None:
+                if attempt < MAX_RETRIES and _is_retryable(error):
+                    delay = RETRY_BASE_DELAY * (2 ** attempt) + random.uniform(0, RETRY_BASE_DELAY)
+                    logging.warning(f"{self.agent}: Gemini call failed ({error}), retrying in {delay:.1f}s "
+                                    f"({attempt + 1}/{MAX_RETRIES})...")
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                _record(self.agent, time.perf_counter() - started, error=error, retries=attempt)
+                raise error
+
+            def _complete(response, error=None):
+                prompt_tokens, response_tokens = _usage(response)
+                if prompt_tokens or response_tokens:
+                    _token_bucket.adjust(prompt_tokens + response_tokens - estimated_tokens)
+                _record(self.agent, time.perf_counter() - started, prompt_tokens, response_tokens,
+                        error=error, retries=attempt)
+
+            if stream:
+                return _StreamingResponse(response, _complete)
+            _complete(response)
+            return response
+
+    def generate_content(self, contents, cache_ttl=None, **kwargs):
+        """
+        Generates content for `contents`.
+
+        With `cache_ttl` (seconds) the response text is cached under a hash of the
+        model configuration, prompt and generation config, and concurrent identical
+        requests share one API call. Only use it for prompts whose answer may be
+        reused for that long.
+        """
+        if not cache_ttl:
+            return self._call(self.model.generate_content, contents, **kwargs)
+        key = make_key(self.cache_namespace, contents, generation_config=kwargs.get("generation_config"))
+        return get_response_cache().get_or_generate(
+            key, cache_ttl, lambda: self._call(self.model.generate_content, contents, **kwargs), call_site=self.agent
+        )
+
+    def start_chat(self, history=None):
+        return ChatSession(self, self.model.start_chat(history=history or []))
+
+class ChatSession:
+    """Chat session whose turns go through the owning LLMClient's limits and metrics."""
+
+    def __init__(self, client, chat):
+        self._client = client
+        self._chat = chat
+
+    def send_message(self, content, stream=False, **kwargs):
+        return self._client._call(self._chat.send_message, content, stream=stream, **kwargs)
+
+    @property
+    def history(self):
+        return self._chat.history
+
+def get_client(agent, model=None, **model_kwargs):
+    """
+    Returns an LLMClient for `agent`, or None if the Gemini API is not configured.
+
+    `model` may be an already-built model (e.g. one created from cached content)
+    or a stub; otherwise a GenerativeModel is created from `model_kwargs`.
+    """
+    if model is None and not configure():
+        return None
+    try:
+        return LLMClient(agent, model=model, **model_kwargs)
+    except Exception as e:
+        logging.error(f"{agent}: Error creating Gemini model: {e}")
+        return None
+
+class LazyClient:
+    """
+    Stand-in for an agent's module-level client that is created on first use.
+
+    Importing an agent therefore neither imports the Gemini SDK nor configures
+    it. Truth-testing resolves the client, so `if not model:` checks keep working
+    and report an unconfigured API the same way a None client does.
+    """
+
+    def __init__(self, agent, **model_kwargs):
+        self.agent = agent
+        self._model_kwargs = model_kwargs
+        self._client = None
+        self._resolved = False
+        self._lock = threading.Lock()
+
+    def resolve(self):
+        if not self._resolved:
+            with self._lock:
+                if not self._resolved:
+                    self._client = get_client(self.agent, **self._model_kwargs)
+                    self._resolved = self._client is not None
+        return self._client
+
+    def __bool__(self):
+        return self.resolve() is not None
+
+    def __getattr__(self, name):
+        client = self.resolve()
+        if client is None:
+            raise RuntimeError(f"{self.agent}: the Gemini API is not configured.")
+        return getattr(client, name)
+
+def lazy_client(agent, **model_kwargs):
+    """Returns a LazyClient for `agent`; see get_client for the arguments."""
+    return LazyClient(agent, **model_kwargs)
+
+def warm_up(*clients):
+    """Imports and configures the Gemini SDK and creates `clients` ahead of the first request."""
+    for client in clients:
+        if isinstance(client, LazyClient):
+            client.resolve()
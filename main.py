@@ -1,95 +1,548 @@
-from fastapi import FastAPI, HTTPException, APIRouter
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, APIRouter, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+import asyncio
+import datetime
+import functools
+import json
 import logging
 import os
+import time
 
 # New unified auth imports
-from auth import get_gmail_service, get_calendar_service
+from auth import get_gmail_service, get_calendar_service, warm_up as warm_up_google_clients
+from auth import refresh_flight as credentials_flight, has_credentials
 
 # Gmail agent imports
-from gmail.service import get_todays_emails
-from agent.agent import analyze_emails as analyze_gmail_emails
+from gmail.service import get_todays_emails, sync_flight as gmail_sync_flight
+from agent.agent import analyze_emails as analyze_gmail_emails, iter_todos as iter_gmail_todos
+from agent.agent import model as gmail_agent_model, analysis_flight
+from agent.cache import get_analysis_cache
+from agent.triage import stats as triage_stats
 
 # FRIDAY chatbot import
-from friday_chatbot_agent import get_friday_response
+from friday_chatbot_agent import get_friday_response, stream_friday_response, get_session_usage
+from friday_chatbot_agent import model as chatbot_model
 
 # Context Manager import
-from context_manager import get_user_context
+from context_manager import get_user_context, validate_user_id
+from context_manager import start_watching as start_watching_contexts, stop_watching as stop_watching_contexts
 
 # Recommendation agent import
-from recommendation.agent import generate_recommendations
+from recommendation.agent import generate_recommendations, model as recommendation_model
 
 # Calendar integration import
-from calendar_integration.service import get_todays_calendar_events
+from calendar_integration.service import get_todays_calendar_events, get_events_between, get_user_timezone
+from calendar_integration.service import sync_flight as calendar_sync_flight
+from calendar_integration.store import get_event_store
+from gmail.store import get_mailbox_store
 
 # New Pulse Agent import
-from pulse_agent import get_pulse_updates
+from pulse_agent import get_pulse_updates, model as pulse_model
+
+# Shared LLM client metrics
+from llm_client import get_metrics as get_llm_metrics, warm_up as warm_up_llm_clients
+from llm_cache import get_response_cache
+
+# Spans, counters and Server-Timing headers
+import metrics
+
+# Concurrent stage runner and background precompute
+from orchestrator import run_stages, stream_stages
+from scheduler import PrecomputeScheduler, format_timestamp
+from state_backend import get_state_backend
+
+# --- Stage Configuration ---
+EMAIL_STAGE_TIMEOUT = float(os.getenv("TODAY_EMAIL_STAGE_TIMEOUT", "90"))
+PULSE_STAGE_TIMEOUT = float(os.getenv("TODAY_PULSE_STAGE_TIMEOUT", "30"))
+CALENDAR_STAGE_TIMEOUT = float(os.getenv("TODAY_CALENDAR_STAGE_TIMEOUT", "20"))
+RECOMMENDATIONS_STAGE_TIMEOUT = float(os.getenv("RECOMMENDATIONS_STAGE_TIMEOUT", "120"))
+
+# With precompute enabled, a background loop refreshes every dashboard stage
+# and the endpoints serve its latest snapshot instead of working per request.
+PRECOMPUTE_ENABLED = os.getenv("PRECOMPUTE_ENABLED", "true").lower() == "true"
+PRECOMPUTE_INTERVAL_SECONDS = float(os.getenv("PRECOMPUTE_INTERVAL_SECONDS", "300"))
+# How long a request waits for the very first snapshot before giving up.
+PRECOMPUTE_READY_TIMEOUT = float(os.getenv("PRECOMPUTE_READY_TIMEOUT", "120"))
+# Users whose dashboards are precomputed, besides the default user (comma-separated IDs).
+PRECOMPUTE_USERS = [u.strip() for u in os.getenv("PRECOMPUTE_USERS", "").split(",") if u.strip()]
+
+# Google and Gemini client libraries are imported lazily. By default they are
+# warmed up on a background thread right after startup; in fast-startup mode
+# (e.g. many workers, or --reload during development) they load on first use.
+FAST_STARTUP = os.getenv("FRIDAY_FAST_STARTUP", "false").lower() == "true"
+
+# With the context watcher running, loaded profiles are re-checked by one
+# background thread instead of being stat()ed on the request path.
+CONTEXT_WATCH_ENABLED = os.getenv("CONTEXT_WATCH_ENABLED", "true").lower() == "true"
+
+def fetch_todays_emails(user_id=None):
+    gmail_service = get_gmail_service(user_id)
+    if not gmail_service:
+        raise RuntimeError("Failed to connect to Gmail service.")
+    emails = get_todays_emails(gmail_service, store=get_mailbox_store(user_id))
+    if emails is None:
+        raise RuntimeError("Failed to fetch emails.")
+    return emails
+
+def _require_gmail_agent():
+    if not gmail_agent_model:
+        raise RuntimeError("The Gemini API is not configured.")
+
+def get_gmail_todos(user_id=None):
+    """Email pipeline stage: fetch today's unread mail and extract to-dos, raising if no email could be analyzed."""
+    _require_gmail_agent()
+    analysis = analyze_gmail_emails(fetch_todays_emails(user_id))
+    if "error" in analysis:
+        raise RuntimeError(analysis["error"])
+    return analysis.get("todos", [])
+
+def stream_gmail_todos(emit, user_id=None):
+    """Streaming email stage: emits each to-do as soon as its email is analyzed."""
+    _require_gmail_agent()
+    count = 0
+    for todo in iter_gmail_todos(fetch_todays_emails(user_id)):
+        emit(todo)
+        count += 1
+    return count
+
+def get_team_updates(user_id=None):
+    """Pulse stage: generate the team pulse, raising if it failed."""
+    updates = get_pulse_updates(user_id)
+    if isinstance(updates, dict) and "error" in updates:
+        raise RuntimeError(updates["error"])
+    return updates
+
+def stream_pulse_updates(emit, user_id=None):
+    """Streaming pulse stage: emits each pulse item once generated."""
+    updates = get_team_updates(user_id)
+    for update in updates:
+        emit(update)
+    return len(updates)
+
+def get_calendar_events(user_id=None):
+    """Calendar stage: fetch today's events."""
+    service = get_calendar_service(user_id)
+    if not service:
+        raise RuntimeError("Failed to connect to Calendar service.")
+    events = get_todays_calendar_events(
+        service, store=get_event_store(user_id), service_factory=lambda: get_calendar_service(user_id)
+    )
+    if events is None:
+        raise RuntimeError("Failed to fetch calendar events.")
+    return events
+
+def get_recommendations(user_id=None, force_refresh=False):
+    """Recommendations stage; `force_refresh` regenerates them instead of serving the cached ones."""
+    recommendations = generate_recommendations(force_refresh=force_refresh, user_id=user_id)
+    if "error" in recommendations:
+        raise RuntimeError(recommendations["error"])
+    return recommendations
+
+def _precompute_stages(user_id):
+    # Every stage raises on failure, so the scheduler keeps the previous snapshot
+    # and reports the error instead of storing an empty result as fresh data.
+    return {
+        "todos": (functools.partial(get_gmail_todos, user_id), EMAIL_STAGE_TIMEOUT),
+        "team_updates": (functools.partial(get_team_updates, user_id), PULSE_STAGE_TIMEOUT),
+        "calendar": (functools.partial(get_calendar_events, user_id), CALENDAR_STAGE_TIMEOUT),
+        "recommendations": (functools.partial(get_recommendations, user_id), RECOMMENDATIONS_STAGE_TIMEOUT),
+    }
+
+# One scheduler per precomputed user, created at startup (see lifespan) so that
+# importing this module does not open the state backend. Snapshots live in the
+# shared backend, so each is refreshed by one worker per interval and served by all of them.
+schedulers = {}
+
+def _create_schedulers():
+    return {
+        user_id: PrecomputeScheduler(
+            _precompute_stages(user_id),
+            PRECOMPUTE_INTERVAL_SECONDS,
+            backend=get_state_backend(),
+            owner=user_id or "default",
+            # A forced refresh (POST /api/snapshot/refresh) regenerates the recommendations
+            # rather than serving them from the agent's 24-hour cache.
+            forced_stages={"recommendations": (
+                functools.partial(get_recommendations, user_id, force_refresh=True), RECOMMENDATIONS_STAGE_TIMEOUT,
+            )},
+        )
+        for user_id in [None, *PRECOMPUTE_USERS]
+    }
+
+def _scheduler_for(user_id):
+    """Returns the running scheduler for `user_id`, or None if that user's dashboard is not precomputed."""
+    scheduler = schedulers.get(user_id)
+    return scheduler if scheduler is not None and scheduler.running else None
+
+def _check_user_id(user_id):
+    """Rejects malformed user IDs (400) and users without a stored authorization (404)."""
+    if user_id is not None:
+        try:
+            validate_user_id(user_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # Checked before any per-user token, store or session is touched.
+        if not has_credentials(user_id):
+            raise HTTPException(status_code=404, detail=f"Unknown user: {user_id!r}")
+
+def warm_up():
+    """Loads the client libraries and creates every agent's Gemini client."""
+    try:
+        warm_up_google_clients()
+        warm_up_llm_clients(gmail_agent_model, pulse_model, recommendation_model, chatbot_model)
+        logging.info("Client libraries warmed up.")
+    except Exception as e:
+        logging.error(f"Warm-up failed; clients will load on first use: {e}")
+
+@asynccontextmanager
+async def lifespan(app):
+    if not FAST_STARTUP:
+        asyncio.get_running_loop().run_in_executor(None, warm_up)
+    if CONTEXT_WATCH_ENABLED:
+        start_watching_contexts()
+    schedulers.update(_create_schedulers())
+    if PRECOMPUTE_ENABLED:
+        for scheduler in schedulers.values():
+            scheduler.start()
+    yield
+    for scheduler in schedulers.values():
+        await scheduler.stop()
+    schedulers.clear()
+    stop_watching_contexts()
 
 # --- Basic Setup ---
-app = FastAPI(title="Personal AI Assistant")
+app = FastAPI(title="Personal AI Assistant", lifespan=lifespan)
 logging.basicConfig(level=logging.INFO)
 
+async def server_timing_middleware(request: Request, call_next):
+    """
+    Times each request and reports its spans (Gmail, extraction, LLM, calendar)
+    in a Server-Timing header. For streamed responses the header is sent with
+    the first byte, so it only covers the work done before streaming started.
+    """
+    timings, token = metrics.start_request()
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        metrics.end_request(token)
+    elapsed = time.perf_counter() - started
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    metrics.observe("friday_http_request_seconds", elapsed, method=request.method, route=route)
+    response.headers["Server-Timing"] = timings.server_timing(total=elapsed)
+    return response
+
+if metrics.METRICS_ENABLED:
+    app.middleware("http")(server_timing_middleware)
+
+def _collect_app_metrics():
+    """Exports the counters the agents and caches already keep, read at scrape time."""
+    llm = get_llm_metrics()
+    yield "friday_llm_requests_total", "counter", "Gemini calls, by agent.", [
+        ({"agent": agent}, m["requests"]) for agent, m in llm.items()
+    ]
+    yield "friday_llm_errors_total", "counter", "Gemini calls that failed after retries.", [
+        ({"agent": agent}, m["errors"]) for agent, m in llm.items()
+    ]
+    yield "friday_llm_retries_total", "counter", "Gemini call retries.", [
+        ({"agent": agent}, m["retries"]) for agent, m in llm.items()
+    ]
+    yield "friday_llm_tokens_total", "counter", "Tokens reported by Gemini, by agent and kind.", [
+        sample for agent, m in llm.items() for sample in (
+            ({"agent": agent, "kind": "prompt"}, m["prompt_tokens"]),
+            ({"agent": agent, "kind": "response"}, m["response_tokens"]),
+        )
+    ]
+    cache_stats = get_response_cache().stats()
+    yield "friday_llm_cache_lookups_total", "counter", "LLM response cache lookups, by call site and result.", [
+        ({"call_site": site, "result": result}, count)
+        for result in ("hits", "misses") for site, count in cache_stats[result].items()
+    ]
+    analysis_stats = get_analysis_cache().stats()
+    yield "friday_analysis_cache_lookups_total", "counter", "Email analysis cache lookups, by result.", [
+        ({"result": "hit"}, analysis_stats["hits"]), ({"result": "miss"}, analysis_stats["misses"]),
+    ]
+    yield "friday_analysis_cache_evictions_total", "counter", "Email analyses evicted by the size cap.", [
+        ({}, analysis_stats["evictions"]),
+    ]
+    triage = triage_stats.report()
+    yield "friday_triage_emails_total", "counter", "Unique emails checked by triage, by outcome.", [
+        ({"outcome": "skipped"}, triage["skipped"]),
+        ({"outcome": "analyzed"}, triage["checked"] - triage["skipped"]),
+    ]
+    flights = {
+        "credentials": credentials_flight, "gmail_sync": gmail_sync_flight,
+        "calendar_sync": calendar_sync_flight, "email_analysis": analysis_flight,
+    }
+    yield "friday_singleflight_calls_total", "counter", "Coalesced operations, by whether the call ran or shared another's result.", [
+        sample for name, flight in flights.items() for stats in [flight.stats()] for sample in (
+            ({"flight": name, "result": "executed"}, stats["executions"]),
+            ({"flight": name, "result": "shared"}, stats["shared"]),
+        )
+    ]
+    now = time.time()
+    yield "friday_snapshot_age_seconds", "gauge", "Age of each precomputed dashboard stage.", [
+        ({"owner": scheduler.owner, "stage": name}, round(now - entry["updated_at"], 1))
+        for scheduler in schedulers.values() for name in scheduler.stages
+        for entry in [scheduler.get(name)] if entry is not None and entry["updated_at"] is not None
+    ]
+
+metrics.registry.register_collector(_collect_app_metrics)
+
 # --- API Routers ---
 api_router = APIRouter(prefix="/api")
 
+async def _snapshot_entry(scheduler, name):
+    """Returns the precomputed entry for stage `name`, waiting for the first cycle if needed."""
+    await scheduler.wait_ready([name], timeout=PRECOMPUTE_READY_TIMEOUT)
+    return scheduler.get(name)
+
+def _set_freshness(response, entry):
+    updated_at = format_timestamp(entry["updated_at"])
+    if updated_at:
+        response.headers["X-Data-Updated-At"] = updated_at
+
 # --- Combined Today Summary API ---
 @api_router.get("/today_summary", tags=["API - Today Summary"])
-def get_today_summary_api():
+async def get_today_summary_api(include_calendar: bool = False, user_id: str | None = None):
     """
-    API endpoint that combines Gmail to-dos and Pulse updates.
+    API endpoint that combines Gmail to-dos and Pulse updates (and optionally calendar events).
+
+    The stages are independent and run concurrently, each with its own timeout.
+    If a stage fails or is too slow its section is left empty and the reason is
+    reported under "errors"; the request only fails if every stage does.
+
+    When the background scheduler is running the sections come from its latest
+    snapshot, with each section's refresh time under "updated_at".
     """
-    # 1. Get To-dos from Gmail
-    gmail_service = get_gmail_service()
-    if not gmail_service:
-        raise HTTPException(status_code=500, detail="Failed to connect to Gmail service.")
-    emails = get_todays_emails(gmail_service)
-    if emails is None:
-        raise HTTPException(status_code=500, detail="Failed to fetch emails.")
-    
-    gmail_summary = analyze_gmail_emails(emails)
-    
-    # 2. Get Team & Beyond Pulse
-    pulse_updates = get_pulse_updates()
-
-    # 3. Combine and return
-    return {
-        "todos": gmail_summary.get("todos", []),
-        "team_updates": pulse_updates
+    _check_user_id(user_id)
+    stages = {
+        "todos": (functools.partial(get_gmail_todos, user_id), EMAIL_STAGE_TIMEOUT),
+        "team_updates": (functools.partial(get_team_updates, user_id), PULSE_STAGE_TIMEOUT),
     }
+    if include_calendar:
+        stages["calendar"] = (functools.partial(get_calendar_events, user_id), CALENDAR_STAGE_TIMEOUT)
+
+    scheduler = _scheduler_for(user_id)
+    if scheduler:
+        await scheduler.wait_ready(list(stages), timeout=PRECOMPUTE_READY_TIMEOUT)
+        results, errors, updated_at = {}, {}, {}
+        for name in stages:
+            entry = scheduler.get(name) or {"data": None, "updated_at": None, "error": "Not computed yet."}
+            if entry["updated_at"] is not None:
+                results[name] = entry["data"]
+            if entry["error"]:
+                errors[name] = entry["error"]
+            updated_at[name] = format_timestamp(entry["updated_at"])
+        if not results:
+            raise HTTPException(status_code=500, detail=errors)
+        summary = {name: results.get(name, []) for name in stages}
+        summary["errors"] = errors
+        summary["updated_at"] = updated_at
+        return summary
+
+    results, errors = await run_stages(stages)
+    if not results:
+        raise HTTPException(status_code=500, detail=errors)
+
+    summary = {name: results.get(name, []) for name in stages}
+    summary["errors"] = errors
+    return summary
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@api_router.get("/today_summary/stream", tags=["API - Today Summary"])
+async def stream_today_summary_api(user_id: str | None = None):
+    """
+    Server-Sent Events version of /today_summary.
+
+    Emits a "todo" event per to-do and a "team_update" event per pulse item as soon
+    as they are ready, "stage_done"/"stage_error" when a section is complete, and a
+    final "done" event. Sections already in the precompute snapshot are replayed
+    from it immediately; "stage_done" then carries their "updated_at".
+    """
+    _check_user_id(user_id)
+    stages = {
+        "todos": (functools.partial(stream_gmail_todos, user_id=user_id), EMAIL_STAGE_TIMEOUT),
+        "team_updates": (functools.partial(stream_pulse_updates, user_id=user_id), PULSE_STAGE_TIMEOUT),
+    }
+    item_events = {"todos": "todo", "team_updates": "team_update"}
+    precomputed = {}
+    scheduler = _scheduler_for(user_id)
+    if scheduler:
+        for name in stages:
+            entry = scheduler.get(name)
+            if entry is not None and entry["updated_at"] is not None and isinstance(entry["data"], list):
+                precomputed[name] = entry
+        stages = {name: stage for name, stage in stages.items() if name not in precomputed}
+
+    async def event_stream():
+        for name, entry in precomputed.items():
+            for item in entry["data"]:
+                yield _sse(item_events[name], item)
+            yield _sse("stage_done", {
+                "stage": name, "count": len(entry["data"]), "updated_at": format_timestamp(entry["updated_at"]),
+            })
+        async for name, kind, payload in stream_stages(stages):
+            if kind == "item":
+                yield _sse(item_events[name], payload)
+            elif kind == "done":
+                yield _sse("stage_done", {"stage": name, "count": payload})
+            else:
+                yield _sse("stage_error", {"stage": name, "detail": payload})
+        yield _sse("done", {})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@api_router.get("/analysis_cache/stats", tags=["API - Today Summary"])
+def get_analysis_cache_stats_api():
+    """Returns hit/miss/eviction counters and the size of the per-message email analysis cache."""
+    return get_analysis_cache().stats()
+
+@api_router.get("/snapshot", tags=["API - Today Summary"])
+def get_snapshot_status_api(user_id: str | None = None):
+    """Freshness and last error of each precomputed stage."""
+    _check_user_id(user_id)
+    if user_id not in schedulers:
+        raise HTTPException(status_code=404, detail="This user's dashboard is not precomputed.")
+    return schedulers[user_id].status()
+
+@api_router.post("/snapshot/refresh", tags=["API - Today Summary"])
+async def refresh_snapshot_api(wait: bool = False, user_id: str | None = None):
+    """Refreshes every precomputed stage now; with `wait`, returns once the refresh is done."""
+    _check_user_id(user_id)
+    scheduler = _scheduler_for(user_id)
+    if not scheduler:
+        raise HTTPException(status_code=503, detail="Background precompute is disabled for this user.")
+    if wait:
+        await scheduler.refresh(force=True)
+    else:
+        scheduler.trigger()
+    return scheduler.status()
+
+@api_router.get("/triage/stats", tags=["API - Today Summary"])
+def get_triage_stats_api():
+    """Returns how many emails the heuristic triage skipped (LLM analyses saved) and why."""
+    return triage_stats.report()
 
 # --- Calendar API ---
 @api_router.get("/calendar/today", tags=["API - Calendar"])
-def get_calendar_events_api():
+async def get_calendar_events_api(response: Response, user_id: str | None = None):
     """API endpoint to get today's calendar events."""
-    service = get_calendar_service()
-    if not service:
-        raise HTTPException(status_code=500, detail="Failed to connect to Calendar service.")
-    events = get_todays_calendar_events(service)
-    return events
+    _check_user_id(user_id)
+    scheduler = _scheduler_for(user_id)
+    if scheduler:
+        entry = await _snapshot_entry(scheduler, "calendar")
+        if entry is None or entry["updated_at"] is None:
+            raise HTTPException(status_code=500, detail=entry["error"] if entry else "Calendar not available yet.")
+        _set_freshness(response, entry)
+        return entry["data"]
+    try:
+        return await run_in_threadpool(get_calendar_events, user_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/calendar/events", tags=["API - Calendar"])
+def get_calendar_range_api(start: datetime.date, end: datetime.date, user_id: str | None = None):
+    """
+    Events from `start` up to and including `end` (dates in the user's time zone),
+    answered from the locally synced event store without calling the Calendar API.
+    """
+    _check_user_id(user_id)
+    if end < start:
+        raise HTTPException(status_code=400, detail="`end` must not be before `start`.")
+    store = get_event_store(user_id)
+    if not store:
+        raise HTTPException(status_code=503, detail="Calendar store is not available.")
+    tz = get_user_timezone(store)
+    range_start = datetime.datetime.combine(start, datetime.time.min, tzinfo=tz)
+    range_end = datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min, tzinfo=tz)
+    return get_events_between(range_start, range_end, store=store)
 
 # --- FRIDAY Chatbot API ---
 class ChatRequest(BaseModel):
     message: str
     session_id: str
+    user_id: str | None = None
 
 @api_router.post("/friday/chat", tags=["API - FRIDAY Chatbot"])
 def chat_with_friday(request: ChatRequest):
-    return get_friday_response(request.message, request.session_id)
+    _check_user_id(request.user_id)
+    return get_friday_response(request.message, request.session_id, user_id=request.user_id)
+
+@api_router.post("/friday/chat/stream", tags=["API - FRIDAY Chatbot"])
+def stream_chat_with_friday(request: ChatRequest):
+    """
+    Server-Sent Events version of /friday/chat: a "token" event per chunk of the
+    answer as Gemini produces it, then "done" with the full response (or "error").
+    """
+    _check_user_id(request.user_id)
+
+    def event_stream():
+        for event, text in stream_friday_response(request.message, request.session_id, user_id=request.user_id):
+            yield _sse(event, {"text": text})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@api_router.get("/friday/sessions/{session_id}/usage", tags=["API - FRIDAY Chatbot"])
+def get_chat_session_usage(session_id: str, user_id: str | None = None):
+    """Token-accounting report for a chat session (tokens per turn, time to first token)."""
+    _check_user_id(user_id)
+    usage = get_session_usage(session_id, user_id=user_id)
+    if usage is None:
+        raise HTTPException(status_code=404, detail="Session not found.")
+    return usage
 
 # --- Recommendation API ---
 @api_router.get("/recommendations", tags=["API - Recommendation Engine"])
-def get_recommendations_api():
-    recommendations = generate_recommendations()
-    if "error" in recommendations:
-        raise HTTPException(status_code=500, detail=recommendations["error"])
-    return recommendations
+async def get_recommendations_api(response: Response, user_id: str | None = None):
+    _check_user_id(user_id)
+    scheduler = _scheduler_for(user_id)
+    if scheduler:
+        entry = await _snapshot_entry(scheduler, "recommendations")
+        if entry is None or entry["updated_at"] is None:
+            raise HTTPException(status_code=500, detail=entry["error"] if entry else "Recommendations not available yet.")
+        _set_freshness(response, entry)
+        return entry["data"]
+    try:
+        return await run_in_threadpool(get_recommendations, user_id)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# --- LLM Metrics API ---
+@api_router.get("/llm/metrics", tags=["API - Metrics"])
+def read_llm_metrics():
+    """Per-agent Gemini request, error, retry, token and latency counters."""
+    return get_llm_metrics()
+
+@api_router.get("/metrics", tags=["API - Metrics"], response_class=PlainTextResponse)
+def read_metrics():
+    """Span timings, request latencies and agent/cache counters in the Prometheus text format."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@api_router.get("/llm/cache/stats", tags=["API - Metrics"])
+def read_llm_cache_stats():
+    """Hit/miss counters per call site for the shared LLM response cache."""
+    return get_response_cache().stats()
 
 # --- Context API ---
 @api_router.get("/context", tags=["API - Context"])
-def read_user_context():
-    return get_user_context()
+def read_user_context(user_id: str | None = None):
+    _check_user_id(user_id)
+    return get_user_context(user_id)
 
 # --- Main Application Setup ---
 app.include_router(api_router)
@@ -0,0 +1,214 @@
+import contextvars
+import functools
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+METRICS_ENABLED = os.getenv("FRIDAY_METRICS", "true").lower() == "true"
+# Histogram buckets (seconds) for span and request durations.
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Registry:
+    """
+    Process-wide counters and duration histograms, rendered in the Prometheus
+    text exposition format.
+
+    Series are keyed by metric name and a sorted tuple of label pairs. Values
+    that other modules already count (LLM usage, cache hit rates, ...) are not
+    duplicated here; they are read at render time through registered collectors.
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., sum, count]
+        self._help = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def register_collector(self, collect):
+        """
+        Adds `collect()`, called on every render. It returns an iterable of
+        (name, type, help, samples) where samples are (labels dict, value) pairs.
+        """
+        self._collectors.append(collect)
+
+    def render(self):
+        lines = []
+
+        def _header(name, kind, help_text):
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(series)) for key, series in self._histograms.items())
+
+        previous = None
+        for (name, labels), value in counters:
+            if name != previous:
+                _header(name, "counter", self._help.get(name))
+                previous = name
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        previous = None
+        for (name, labels), series in histograms:
+            if name != previous:
+                _header(name, "histogram", self._help.get(name))
+                previous = name
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', repr(bound)),))} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {series[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(series[-2])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {series[-1]}")
+
+        for collect in self._collectors:
+            for name, kind, help_text, samples in collect():
+                _header(name, kind, help_text)
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(tuple(sorted(labels.items())))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{_escape(value)}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+registry = Registry()
+registry.describe("friday_span_seconds", "Time spent in instrumented operations.")
+registry.describe("friday_span_errors_total", "Instrumented operations that raised.")
+registry.describe("friday_http_request_seconds", "HTTP request handling time, by route.")
+
+# --- Per-request timings (Server-Timing) ---
+class RequestTimings:
+    """Span durations accumulated while handling one request, by span name."""
+
+    def __init__(self):
+        self._timings = {}  # name -> [total seconds, count]
+        self._lock = threading.Lock()
+
+    def add(self, name, elapsed):
+        with self._lock:
+            timing = self._timings.setdefault(name, [0.0, 0])
+            timing[0] += elapsed
+            timing[1] += 1
+
+    def server_timing(self, total=None):
+        """Returns a Server-Timing header value; spans that ran several times report their summed duration."""
+        with self._lock:
+            timings = sorted(self._timings.items())
+        entries = [
+            f'{name};dur={elapsed * 1000:.1f}' + (f';desc="{count} calls"' if count > 1 else "")
+            for name, (elapsed, count) in timings
+        ]
+        if total is not None:
+            entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+def start_request():
+    """Starts collecting span timings for the current request. Returns (timings, token for end_request)."""
+    timings = RequestTimings()
+    return timings, _request_timings.set(timings)
+
+def end_request(token):
+    _request_timings.reset(token)
+
+def propagate(func):
+    """
+    Wraps `func` so spans it runs on a pool thread count towards the current
+    request's Server-Timing (executor threads do not inherit context variables).
+    """
+    if not METRICS_ENABLED:
+        return func
+    timings = _request_timings.get()
+    if timings is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _request_timings.set(timings)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _request_timings.reset(token)
+    return wrapper
+
+# --- Spans ---
+class Span:
+    """Times a block into friday_span_seconds and the current request's Server-Timing."""
+
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        registry.observe("friday_span_seconds", elapsed, span=self.name, **self.labels)
+        if exc_type is not None:
+            registry.inc("friday_span_errors_total", span=self.name, **self.labels)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.add(self.name, elapsed)
+        return False
+
+_NOOP = nullcontext()
+
+def span(name, **labels):
+    """
+    Returns a context manager timing the enclosed block as span `name`.
+
+    Keep labels low-cardinality (agent or call-site names, not IDs). With
+    FRIDAY_METRICS=false this returns a shared no-op context manager.
+    """
+    if not METRICS_ENABLED:
+        return _NOOP
+    return Span(name, labels)
+
+def inc(name, amount=1, **labels):
+    """Increments counter `name`; a no-op when metrics are disabled."""
+    if METRICS_ENABLED:
+        registry.inc(name, amount, **labels)
+
+def observe(name, value, **labels):
+    if METRICS_ENABLED:
+        registry.observe(name, value, **labels)
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import time
+
+async def run_stage(name, func, timeout, *args, **kwargs):
+    """
+    Runs a blocking pipeline stage on a worker thread with a timeout.
+
+    Returns (result, error); exactly one of them is None. A stage that times out
+    keeps running in its thread, but its result is no longer waited for.
+    """
+    started = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(asyncio.to_thread(func, *args, **kwargs), timeout=timeout)
+        logging.info(f"Stage '{name}' finished in {time.perf_counter() - started:.2f}s.")
+        return result, None
+    except asyncio.TimeoutError:
+        logging.error(f"Stage '{name}' timed out after {timeout}s.")
+        return None, f"Timed out after {timeout}s."
+    except Exception as e:
+        logging.error(f"Stage '{name}' failed: {e}")
+        return None, str(e)
+
+async def run_stages(stages):
+    """
+    Runs independent stages concurrently.
+
+    `stages` maps a stage name to a (func, timeout) pair. Returns (results, errors)
+    dicts keyed by stage name, so callers can return partial results when some
+    stages fail or are slow. Total latency is that of the slowest stage.
+    """
+    names = list(stages)
+    outcomes = await asyncio.gather(*(run_stage(name, func, timeout) for name, (func, timeout) in stages.items()))
+    results = {}
+    errors = {}
+    for name, (result, error) in zip(names, outcomes):
+        if error is None:
+            results[name] = result
+        else:
+            errors[name] = error
+    return results, errors
+
+async def stream_stages(stages):
+    """
+    Runs independent streaming stages concurrently and yields their output as it arrives.
+
+    `stages` maps a stage name to a (func, timeout) pair; each func is called on a
+    worker thread with an `emit(item)` callback. Yields (name, kind, payload)
+    tuples where kind is "item" (payload is the emitted item), "done" (payload is
+    the stage's return value) or "error" (payload is the error message). Every
+    stage ends with exactly one "done" or "error" event.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    async def _run(name, func, timeout):
+        emit = lambda item: loop.call_soon_threadsafe(queue.put_nowait, (name, "item", item))
+        result, error = await run_stage(name, func, timeout, emit)
+        if error is None:
+            queue.put_nowait((name, "done", result))
+        else:
+            queue.put_nowait((name, "error", error))
+
+    tasks = [asyncio.create_task(_run(name, func, timeout)) for name, (func, timeout) in stages.items()]
+    pending = set(stages)
+    try:
+        while pending:
+            name, kind, payload = await queue.get()
+            if name not in pending:
+                continue  # Late output from a stage that already timed out.
+            if kind != "item":
+                pending.discard(name)
+            yield name, kind, payload
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -1,32 +1,25 @@
 import logging
 import os
-import google.generativeai as genai
-import json
-from dotenv import load_dotenv
 from context_manager import get_user_context
+from llm_client import lazy_client
+from structured_output import PulseItem, generate_json
 
 # --- Configuration ---
-load_dotenv()
-
-try:
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY not found in .env file.")
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    logging.info("Pulse Agent: Gemini API configured successfully.")
-except Exception as e:
-    logging.error(f"Pulse Agent: Error configuring Gemini API: {e}")
-    model = None
-
-def get_pulse_updates():
+model = lazy_client("pulse_agent")
+
+# The pulse prompt only depends on team and area, so identical prompts (same
+# user, or teammates) are answered from the shared LLM response cache.
+PULSE_CACHE_TTL_SECONDS = int(os.getenv("PULSE_CACHE_TTL_SECONDS", str(12 * 3600)))
+
+def get_pulse_updates(user_id=None):
     """
-    Uses the Gemini API to generate a "Team & Beyond Pulse" based on user context.
+    Uses the Gemini API to generate a "Team & Beyond Pulse" based on user context
+    (the default user's, or `user_id`'s).
     """
     if not model:
         return {"error": "The Gemini API is not configured."}
 
-    user_context = get_user_context()
+    user_context = get_user_context(user_id)
     if user_context.get("name", "Not Set") == "Not Set":
         return [] # Return empty list if context is not set
 
@@ -53,11 +46,11 @@ def get_pulse_updates():
         """
         
         logging.info("Generating pulse updates with Gemini API...")
-        response = model.generate_content(prompt)
-        
-        cleaned_response = response.text.strip().replace("```json", "").replace("```", "")
-        return json.loads(cleaned_response)
+        items = generate_json(model, prompt, PulseItem, many=True, cache_ttl=PULSE_CACHE_TTL_SECONDS)
+        return [item.model_dump() for item in items]
 
     except Exception as e:
+        # Reported as an error (like the recommendation agent) rather than as an
+        # empty pulse, so callers can tell "nothing new" from a quota or API failure.
         logging.error(f"Error in pulse generation: {e}")
-        return []
+        return {"error": str(e)}
@@ -1,36 +1,116 @@
+import hashlib
 import logging
 import os
-import google.generativeai as genai
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import json
-from dotenv import load_dotenv
-from context_manager import get_user_context
+from context_manager import get_user_context, subscribe as subscribe_to_context
+from llm_client import lazy_client
+from metrics import propagate
+from singleflight import SingleFlight
+from structured_output import Recommendations, generate_json
 
 # --- Configuration ---
-load_dotenv()
-
-try:
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY not found in .env file.")
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    logging.info("Recommendation Agent: Gemini API configured successfully.")
-except Exception as e:
-    logging.error(f"Recommendation Agent: Error configuring Gemini API: {e}")
-    model = None
-
-def generate_recommendations():
+model = lazy_client("recommendation_agent")
+
+# --- Caching ---
+# Recommendations change daily at most, so results are cached per user context
+# (and each step's LLM response in the shared response cache, which survives
+# restarts).
+# Once an entry is older than CACHE_TTL_SECONDS it is still served (up to
+# CACHE_MAX_STALE_SECONDS) while a background refresh replaces it.
+CACHE_TTL_SECONDS = int(os.getenv("RECOMMENDATIONS_CACHE_TTL_SECONDS", str(24 * 3600)))
+CACHE_MAX_STALE_SECONDS = int(os.getenv("RECOMMENDATIONS_CACHE_MAX_STALE_SECONDS", str(7 * 24 * 3600)))
+
+_cache = {}  # context hash -> (recommendations, created_at)
+_refreshing = set()  # keys with a background refresh thread
+_cache_lock = threading.Lock()
+# Concurrent generations for the same context (a cold miss, a forced refresh or a
+# background refresh) share one run rather than each calling the model.
+_refresh_flight = SingleFlight()
+
+def _context_key(user_context):
+    return hashlib.sha256(json.dumps(user_context, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _refresh(key, user_context, response_cache=True):
     """
-    Orchestrates a multi-step LLM process to generate personalized recommendations.
+    Regenerates recommendations for `key`, caching the result unless it is an error.
+
+    A refresh of existing recommendations passes `response_cache=False`, since
+    the cached step responses are exactly what is being replaced. A refresh
+    already in flight for `key` is joined instead of started again.
+    """
+    return _refresh_flight.do(key, _regenerate, key, user_context, response_cache)
+
+def _regenerate(key, user_context, response_cache):
+    recommendations = _generate_recommendations(user_context, CACHE_TTL_SECONDS if response_cache else None)
+    if "error" not in recommendations:
+        with _cache_lock:
+            _cache[key] = (recommendations, time.time())
+    return recommendations
+
+def _refresh_in_background(key, user_context):
+    with _cache_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    logging.info("Recommendation Agent: serving stale recommendations while refreshing in the background.")
+
+    def _run():
+        try:
+            _refresh(key, user_context, response_cache=False)
+        finally:
+            with _cache_lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=_run, name="recommendation-refresh", daemon=True).start()
+
+def invalidate_cache(*_):
+    """Drops all cached recommendations."""
+    with _cache_lock:
+        _cache.clear()
+
+subscribe_to_context(invalidate_cache)
+
+def generate_recommendations(force_refresh=False, user_id=None):
+    """
+    Returns personalized recommendations for the default user (or `user_id`),
+    served from cache when possible.
+
+    Fresh cache entries are returned directly; stale ones are returned
+    immediately while a background refresh runs (stale-while-revalidate).
     """
     if not model:
         return {"error": "The Gemini API is not configured."}
 
-    user_context = get_user_context()
+    user_context = get_user_context(user_id)
     # Use .get() for safe access to context keys
     if user_context.get("name", "Not Set") == "Not Set":
         return {"error": "User context is not set. Please edit context.json."}
 
+    key = _context_key(user_context)
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached and not force_refresh:
+        recommendations, created_at = cached
+        age = time.time() - created_at
+        if age <= CACHE_TTL_SECONDS:
+            return recommendations
+        if age <= CACHE_MAX_STALE_SECONDS:
+            _refresh_in_background(key, user_context)
+            return recommendations
+
+    # Only a first generation may reuse cached step responses; a forced refresh
+    # or an expired entry must reach the model.
+    return _refresh(key, user_context, response_cache=cached is None)
+
+def _generate_recommendations(user_context, cache_ttl=CACHE_TTL_SECONDS):
+    """
+    Orchestrates a multi-step LLM process to generate personalized recommendations.
+
+    Each step's response is cached for `cache_ttl` seconds (None to bypass the cache).
+    """
     try:
         # Safely access context values with defaults
         user_role = user_context.get('role', 'employee')
@@ -63,9 +143,6 @@ def generate_recommendations():
         #### Core Competency: System Reliability
         - **Topic: Site Reliability Engineering (SRE) Principles.** Rationale: This is a core part of Google's engineering culture and is essential for building robust and scalable systems.
         - **Topic: Incident Management & Post-mortems.** Rationale: Learning how to respond to and analyze system failures is a critical skill for maintaining service health and preventing future issues."""
-        logging.info("Step 1: Getting role-specific skills...")
-        role_skills_response = model.generate_content(prompt1)
-        role_skills = role_skills_response.text.strip().split(',')
 
         # Step 2: Get trending topics
         prompt2 = f"""
@@ -91,9 +168,6 @@ def generate_recommendations():
         #### Cloud & Edge Computing
         - **Topic: IoT and Edge Device Management.** Rationale: With the rise of smart devices, exploring how edge computing complements mobile devices is key to building applications for the next generation of hardware.
         """
-        logging.info("Step 2: Getting trending topics...")
-        trending_topics_response = model.generate_content(prompt2)
-        trending_topics = trending_topics_response.text.strip().split(',')
 
         # Step 3: Get event ideas
         prompt3 = f"""You are FRIDAY, an internal events curator for Google employees. Your task is to suggest relevant internal events, workshops, and speaker series to a Google employee based on their team, location, and potential interests.
@@ -123,9 +197,16 @@ def generate_recommendations():
         - **"Google Foodie Club" Happy Hour:** Connect with fellow Googlers in the Bay Area who share your passion for food and network in a casual, fun setting.
         """
 
-        logging.info("Step 3: Getting event ideas...")
-        event_ideas_response = model.generate_content(prompt3)
-        event_ideas = event_ideas_response.text.strip().split(',')
+        # Steps 1-3 are independent of each other, so they run concurrently.
+        logging.info("Steps 1-3: Getting role-specific skills, trending topics and event ideas...")
+        with ThreadPoolExecutor(max_workers=3, thread_name_prefix="recommendation-agent") as executor:
+            generate = propagate(model.generate_content)
+            role_skills_future = executor.submit(generate, prompt1, cache_ttl=cache_ttl)
+            trending_topics_future = executor.submit(generate, prompt2, cache_ttl=cache_ttl)
+            event_ideas_future = executor.submit(generate, prompt3, cache_ttl=cache_ttl)
+        role_skills = role_skills_future.result().text.strip().split(',')
+        trending_topics = trending_topics_future.result().text.strip().split(',')
+        event_ideas = event_ideas_future.result().text.strip().split(',')
 
         # Step 4: Final Synthesis
         final_prompt = f"""
@@ -145,11 +226,8 @@ def generate_recommendations():
         Example for a single item: {{"recommendation": "Advanced Kubernetes Workshop", "reason": "Deepens your expertise in cloud infrastructure, which is crucial for your role on the SRE team."}}
         """
         logging.info("Step 4: Synthesizing final recommendations...")
-        final_response = model.generate_content(final_prompt)
-        
-        # Clean up the response to be valid JSON
-        cleaned_response = final_response.text.strip().replace("```json", "").replace("```", "")
-        return json.loads(cleaned_response)
+        recommendations = generate_json(model, final_prompt, Recommendations, cache_ttl=cache_ttl)
+        return recommendations.model_dump()
 
     except Exception as e:
         logging.error(f"Error in recommendation generation: {e}")
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+
+from orchestrator import run_stages
+
+class PrecomputeScheduler:
+    """
+    Periodically runs pipeline stages in the background and keeps their latest results.
+
+    `stages` maps a stage name to a (func, timeout) pair, as for run_stages. Each
+    cycle runs every stage concurrently; a stage that fails keeps serving its last
+    good result and reports the error alongside it. Stage functions must therefore
+    raise on failure rather than return an empty result. Endpoints read the snapshot
+    instead of doing the work on the request path.
+
+    With a shared state `backend`, the snapshot lives in the backend under
+    `owner` and a lease on it is held for `interval_seconds` per cycle, so only
+    one worker process refreshes it per interval and every worker serves it.
+
+    `forced_stages` optionally replaces some stages in forced (user-requested)
+    cycles, e.g. with variants that bypass their own caches.
+    """
+
+    NAMESPACE = "snapshots"
+
+    def __init__(self, stages, interval_seconds, backend=None, owner="default", forced_stages=None):
+        self.stages = stages
+        self.forced_stages = forced_stages or {}
+        self.interval_seconds = interval_seconds
+        self.backend = backend
+        self.owner = owner
+        self.cycles = 0
+        self._snapshot = {}  # name -> {"data", "updated_at", "error", "error_at"}
+        self._inflight = None
+        self._force_next = False
+        self._wake = None
+        self._task = None
+
+    def start(self):
+        """Starts the refresh loop on the running event loop."""
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    async def _loop(self):
+        while True:
+            force, self._force_next = self._force_next, False
+            await self.refresh(force)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _run_cycle(self, force=False):
+        if self.backend is not None and not force:
+            token = await asyncio.to_thread(
+                self.backend.acquire_lock, f"precompute:{self.owner}", self.interval_seconds
+            )
+            if token is None:
+                return  # Another worker refreshed this snapshot within the interval.
+        started = time.perf_counter()
+        results, errors = await run_stages({**self.stages, **self.forced_stages} if force else self.stages)
+        now = time.time()
+        for name, result in results.items():
+            self._store(name, {"data": result, "updated_at": now, "error": None, "error_at": None})
+        for name, error in errors.items():
+            entry = self.get(name) or {"data": None, "updated_at": None}
+            entry["error"] = error
+            entry["error_at"] = now
+            self._store(name, entry)
+        self.cycles += 1
+        logging.info(f"Precompute cycle {self.cycles} finished in {time.perf_counter() - started:.2f}s "
+                     f"({len(errors)} stage(s) failed).")
+
+    async def refresh(self, force=False):
+        """
+        Runs a refresh cycle now, or joins the one already in progress.
+
+        Unless `force` is set, the cycle is skipped when another worker holds the
+        snapshot's lease.
+        """
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.create_task(self._run_cycle(force))
+        await asyncio.shield(self._inflight)
+
+    def trigger(self):
+        """Requests a refresh without waiting for it."""
+        self._force_next = True
+        if self._wake is not None:
+            self._wake.set()
+
+    async def wait_ready(self, names, timeout):
+        """Waits (up to `timeout` seconds) for the first cycle if any of `names` has never been computed."""
+        def _ready():
+            return all(self.get(name) is not None for name in names)
+
+        async def _wait():
+            await self.refresh()
+            while not _ready():
+                await asyncio.sleep(0.5)  # Another worker holds the lease and is still computing.
+
+        if _ready():
+            return
+        try:
+            await asyncio.wait_for(_wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Precompute snapshot not ready after {timeout}s.")
+
+    def _store(self, name, entry):
+        if self.backend is not None:
+            self.backend.set(self.NAMESPACE, f"{self.owner}:{name}", entry)
+        else:
+            self._snapshot[name] = entry
+
+    def get(self, name):
+        """Returns the snapshot entry for stage `name`, or None if it was never run."""
+        if self.backend is not None:
+            return self.backend.get(self.NAMESPACE, f"{self.owner}:{name}")
+        return self._snapshot.get(name)
+
+    def status(self):
+        return {
+            "running": self.running,
+            "refreshing": self._inflight is not None and not self._inflight.done(),
+            "cycles": self.cycles,
+            "interval_seconds": self.interval_seconds,
+            "stages": {
+                name: {
+                    "updated_at": format_timestamp(entry["updated_at"]),
+                    "age_seconds": round(time.time() - entry["updated_at"], 1) if entry["updated_at"] else None,
+                    "error": entry["error"],
+                    "error_at": format_timestamp(entry["error_at"]),
+                }
+                for name, entry in ((name, self.get(name)) for name in self.stages) if entry is not None
+            },
+        }
+
+def format_timestamp(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
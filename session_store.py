@@ -0,0 +1,143 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from state_backend import STATE_BACKEND, get_state_backend
+
+# "shared" keeps sessions on the shared state backend, so every worker process
+# (and a restarted one) sees them; "memory" keeps them in this process only.
+# Defaults to "shared" unless the state backend itself is process-local.
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "memory" if STATE_BACKEND == "memory" else "shared")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(24 * 3600)))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "1000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(32 * 1024 * 1024)))
+
+def _session_size(session):
+    return len(json.dumps(session))
+
+class InMemorySessionStore:
+    """
+    LRU session store with TTL expiry and caps on session count and total size.
+
+    Sessions are plain JSON-serializable dicts. `get` returns the stored dict;
+    callers must `save` it again after changing it so its size is re-accounted.
+    """
+
+    def __init__(self, max_sessions=SESSION_MAX_SESSIONS, ttl_seconds=SESSION_TTL_SECONDS,
+                 max_bytes=SESSION_MAX_BYTES):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._sessions = OrderedDict()  # session_id -> (session, size, last_access)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            session, size, last_access = entry
+            if time.time() - last_access > self.ttl_seconds:
+                self._remove(session_id)
+                self.evictions += 1
+                return None
+            self._sessions[session_id] = (session, size, time.time())
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def save(self, session_id, session):
+        size = _session_size(session)
+        with self._lock:
+            self._remove(session_id)
+            self._sessions[session_id] = (session, size, time.time())
+            self._total_bytes += size
+            self._evict()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._remove(session_id)
+
+    def _remove(self, session_id):
+        entry = self._sessions.pop(session_id, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
+
+    def _evict(self):
+        now = time.time()
+        for session_id in [sid for sid, (_, _, last) in self._sessions.items() if now - last > self.ttl_seconds]:
+            self._remove(session_id)
+            self.evictions += 1
+        # Always keep the most recently used session, even if it alone exceeds the byte cap.
+        while len(self._sessions) > 1 and (
+            len(self._sessions) > self.max_sessions or self._total_bytes > self.max_bytes
+        ):
+            self._remove(next(iter(self._sessions)))
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "bytes": self._total_bytes,
+                "evictions": self.evictions,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+class SharedSessionStore:
+    """
+    Session store on the shared state backend, so every worker sees every session.
+
+    Sessions expire `ttl_seconds` after their last save; there is no count cap,
+    since the backend (not this process) holds the data.
+    """
+
+    NAMESPACE = "sessions"
+
+    def __init__(self, backend=None, ttl_seconds=SESSION_TTL_SECONDS):
+        self._backend = backend
+        self.ttl_seconds = ttl_seconds
+
+    @property
+    def backend(self):
+        # Without an explicit backend, the process-wide one is opened on first use,
+        # so creating the store at import time does not touch the disk.
+        if self._backend is None:
+            self._backend = get_state_backend()
+        return self._backend
+
+    def get(self, session_id):
+        return self.backend.get(self.NAMESPACE, session_id)
+
+    def save(self, session_id, session):
+        self.backend.set(self.NAMESPACE, session_id, session, ttl_seconds=self.ttl_seconds)
+
+    def delete(self, session_id):
+        self.backend.delete(self.NAMESPACE, session_id)
+
+    def __len__(self):
+        return self.backend.count(self.NAMESPACE)
+
+    def stats(self):
+        return {
+            "backend": f"shared ({type(self.backend).__name__})",
+            "sessions": len(self),
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+def create_session_store(backend=SESSION_STORE_BACKEND):
+    """
+    Creates the session store selected by SESSION_STORE_BACKEND ("shared" or
+    "memory"; "sqlite" is accepted as an alias of "shared").
+    """
+    if backend in ("shared", "sqlite"):
+        return SharedSessionStore()
+    return InMemorySessionStore()
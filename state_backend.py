@@ -0,0 +1,268 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite")
+STATE_DB_FILE = os.path.join(os.getenv("FRIDAY_CACHE_DIR", ".friday_cache"), "state.sqlite3")
+
+class StateBackend:
+    """
+    Interface for state shared by every worker process (and, with a networked
+    implementation, every host).
+
+    Values are JSON-serializable and grouped by namespace ("sessions",
+    "snapshots", ...); entries may carry a TTL. Locks are leases that expire after
+    `ttl_seconds`, so a crashed holder cannot block the others forever. A Redis
+    implementation maps these onto GET/MGET, SET EX, DEL, SCAN and SET NX PX
+    with a token-checked release.
+    """
+
+    def get(self, namespace, key):
+        raise NotImplementedError
+
+    def get_many(self, namespace, keys):
+        """Returns {key: value} for the keys that exist."""
+        found = {}
+        for key in keys:
+            value = self.get(namespace, key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set(self, namespace, key, value, ttl_seconds=None):
+        raise NotImplementedError
+
+    def set_many(self, namespace, items, ttl_seconds=None):
+        for key, value in items.items():
+            self.set(namespace, key, value, ttl_seconds)
+
+    def delete(self, namespace, key):
+        raise NotImplementedError
+
+    def count(self, namespace):
+        raise NotImplementedError
+
+    def trim(self, namespace, max_entries):
+        """
+        Evicts the oldest entries (those closest to expiry) beyond `max_entries`
+        in `namespace`. Returns how many were evicted.
+        """
+        raise NotImplementedError
+
+    def acquire_lock(self, name, ttl_seconds):
+        """Takes the lease `name` if it is free or expired. Returns a token for release_lock, or None."""
+        raise NotImplementedError
+
+    def release_lock(self, name, token):
+        """Releases the lease if it is still held with `token`."""
+        raise NotImplementedError
+
+class MemoryStateBackend(StateBackend):
+    """Process-local backend; state is not shared between workers."""
+
+    def __init__(self):
+        self._values = {}  # (namespace, key) -> (value, expires_at)
+        self._locks = {}  # name -> (token, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._values.get((namespace, key))
+            if entry is None:
+                return None
+            if entry[1] is not None and entry[1] <= time.time():
+                del self._values[(namespace, key)]
+                return None
+            return entry[0]
+
+    def set(self, namespace, key, value, ttl_seconds=None):
+        expires_at = time.time() + ttl_seconds if ttl_seconds else None
+        with self._lock:
+            self._values[(namespace, key)] = (value, expires_at)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._values.pop((namespace, key), None)
+
+    def count(self, namespace):
+        now = time.time()
+        with self._lock:
+            return sum(
+                1 for (ns, _), (_, expires_at) in self._values.items()
+                if ns == namespace and (expires_at is None or expires_at > now)
+            )
+
+    def trim(self, namespace, max_entries):
+        with self._lock:
+            keys = [key for key in self._values if key[0] == namespace]
+            if len(keys) <= max_entries:
+                return 0
+            keys.sort(key=lambda key: self._values[key][1] or float("inf"))
+            for key in keys[:len(keys) - max_entries]:
+                del self._values[key]
+            return len(keys) - max_entries
+
+    def acquire_lock(self, name, ttl_seconds):
+        now = time.time()
+        with self._lock:
+            held = self._locks.get(name)
+            if held is not None and held[1] > now:
+                return None
+            token = uuid.uuid4().hex
+            self._locks[name] = (token, now + ttl_seconds)
+            return token
+
+    def release_lock(self, name, token):
+        with self._lock:
+            if self._locks.get(name, (None,))[0] == token:
+                del self._locks[name]
+
+class SQLiteStateBackend(StateBackend):
+    """
+    Backend in a local SQLite file, shared by every worker process on the host.
+
+    WAL mode lets readers proceed while one worker writes; lock leases are taken
+    with a single conditional upsert, so they are atomic across processes.
+    """
+
+    def __init__(self, path=STATE_DB_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS state (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                PRIMARY KEY (namespace, key)
+            )"""
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS locks (name TEXT PRIMARY KEY, token TEXT, expires_at REAL)")
+        self._conn.commit()
+
+    def get(self, namespace, key):
+        return self.get_many(namespace, [key]).get(key)
+
+    def get_many(self, namespace, keys):
+        if not keys:
+            return {}
+        now = time.time()
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM state WHERE namespace = ? AND key IN ({placeholders}) "
+                    f"AND (expires_at IS NULL OR expires_at > ?)",
+                    (namespace, *chunk, now),
+                ).fetchall()
+                found.update((key, json.loads(value)) for key, value in rows)
+        return found
+
+    def set(self, namespace, key, value, ttl_seconds=None):
+        self.set_many(namespace, {key: value}, ttl_seconds)
+
+    def set_many(self, namespace, items, ttl_seconds=None):
+        if not items:
+            return
+        now = time.time()
+        expires_at = now + ttl_seconds if ttl_seconds else None
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?)",
+                [(namespace, key, json.dumps(value), expires_at) for key, value in items.items()],
+            )
+            self._conn.execute("DELETE FROM state WHERE expires_at <= ?", (now,))
+            self._conn.commit()
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+            self._conn.commit()
+
+    def count(self, namespace):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM state WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, time.time()),
+            ).fetchone()[0]
+
+    def trim(self, namespace, max_entries):
+        with self._lock:
+            evicted = self._conn.execute(
+                """DELETE FROM state WHERE rowid IN (
+                    SELECT rowid FROM state WHERE namespace = ?
+                    ORDER BY expires_at IS NULL DESC, expires_at DESC LIMIT -1 OFFSET ?
+                )""",
+                (namespace, max_entries),
+            ).rowcount
+            self._conn.commit()
+        return max(evicted, 0)
+
+    def acquire_lock(self, name, ttl_seconds):
+        now = time.time()
+        token = uuid.uuid4().hex
+        with self._lock:
+            acquired = self._conn.execute(
+                """INSERT INTO locks VALUES (?, ?, ?)
+                   ON CONFLICT(name) DO UPDATE SET token = excluded.token, expires_at = excluded.expires_at
+                   WHERE locks.expires_at <= ?""",
+                (name, token, now + ttl_seconds, now),
+            ).rowcount
+            self._conn.commit()
+        return token if acquired == 1 else None
+
+    def release_lock(self, name, token):
+        with self._lock:
+            self._conn.execute("DELETE FROM locks WHERE name = ? AND token = ?", (name, token))
+            self._conn.commit()
+
+def run_once(backend, name, compute, load, lease_seconds, poll_interval=0.2):
+    """
+    Cross-process single flight: runs `compute()` in at most one worker at a time.
+
+    The worker holding the lease `name` computes; the others poll `load()` until
+    it returns a value (e.g. the result the holder stored) and return that. If the
+    holder dies, its lease expires and a waiting worker takes over.
+    """
+    while True:
+        token = backend.acquire_lock(name, lease_seconds)
+        if token is not None:
+            try:
+                return compute()
+            finally:
+                backend.release_lock(name, token)
+        time.sleep(poll_interval)
+        value = load()
+        if value is not None:
+            return value
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def create_state_backend(backend=STATE_BACKEND):
+    """Creates the backend selected by STATE_BACKEND ("sqlite" or "memory")."""
+    if backend == "sqlite":
+        try:
+            return SQLiteStateBackend()
+        except sqlite3.Error as e:
+            logging.error(f"Could not open shared state at {STATE_DB_FILE}: {e}. Using process-local state.")
+    return MemoryStateBackend()
+
+def get_state_backend():
+    """Returns the process-wide shared state backend."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_state_backend()
+    return _backend
@@ -0,0 +1,200 @@
+import json
+import logging
+from pydantic import BaseModel, ValidationError, field_validator
+
+# --- Schemas ---
+def _text(value):
+    return "" if value is None else str(value)
+
+class EmailAnalysis(BaseModel):
+    """The Gmail agent's verdict on one email."""
+    is_todo: bool = False
+    summary: str = ""
+    link: str = ""
+
+    @field_validator("is_todo", mode="before")
+    @classmethod
+    def _yes_no(cls, value):
+        if isinstance(value, str):
+            return value.strip().lower() in ("yes", "true", "y")
+        return bool(value)
+
+    @field_validator("summary", "link", mode="before")
+    @classmethod
+    def _optional_text(cls, value):
+        return _text(value)
+
+class BatchEmailAnalysis(EmailAnalysis):
+    """A verdict within a batch response, which must say which email it is for."""
+    id: str
+
+    @field_validator("id", mode="before")
+    @classmethod
+    def _id_to_text(cls, value):
+        return value if value is None else str(value)
+
+class PulseItem(BaseModel):
+    subject: str
+    update: str
+    link: str = ""
+
+    @field_validator("link", mode="before")
+    @classmethod
+    def _optional_text(cls, value):
+        return _text(value)
+
+class Recommendation(BaseModel):
+    recommendation: str
+    reason: str = ""
+
+class Recommendations(BaseModel):
+    role_specific_upskilling: list[Recommendation] = []
+    trending_topics: list[Recommendation] = []
+    internal_events: list[Recommendation] = []
+
+    @field_validator("role_specific_upskilling", "trending_topics", "internal_events", mode="before")
+    @classmethod
+    def _drop_invalid(cls, value):
+        return validate_items(value if isinstance(value, list) else [], Recommendation)
+
+# --- Response schemas for Gemini's JSON mode ---
+_SCHEMA_TYPES = {str: "STRING", bool: "BOOLEAN", int: "INTEGER", float: "NUMBER"}
+
+def _field_schema(annotation):
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return response_schema(annotation)
+    if getattr(annotation, "__origin__", None) is list:
+        return {"type": "ARRAY", "items": _field_schema(annotation.__args__[0])}
+    for python_type, schema_type in _SCHEMA_TYPES.items():
+        if annotation is python_type or python_type in getattr(annotation, "__args__", ()):
+            return {"type": schema_type}
+    return {"type": "STRING"}
+
+def response_schema(model, many=False):
+    """Builds a Gemini response schema (OpenAPI subset) for `model`, or for a list of them with `many`."""
+    schema = {
+        "type": "OBJECT",
+        "properties": {name: _field_schema(field.annotation) for name, field in model.model_fields.items()},
+        "required": [name for name, field in model.model_fields.items() if field.is_required()],
+    }
+    return {"type": "ARRAY", "items": schema} if many else schema
+
+def json_generation_config(model, many=False):
+    return {"response_mime_type": "application/json", "response_schema": response_schema(model, many)}
+
+# --- Tolerant parsing ---
+def _strip_fences(text):
+    return text.strip().replace("```json", "").replace("```", "").strip()
+
+def _repair_truncated(text):
+    """
+    Recovers the longest well-formed prefix of a truncated JSON array or object.
+
+    Cuts the text back to the last point where a value inside a container was
+    complete and closes the containers still open there. Returns None if no
+    prefix parses.
+    """
+    closers = {"[": "]", "{": "}"}
+    stack = []
+    cut_points = []  # (index, open containers) after each complete member
+    in_string = escaped = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in closers:
+            stack.append(char)
+        elif char in "]}":
+            if not stack:
+                break
+            stack.pop()
+            if not stack:
+                return None  # Complete top-level value, so the problem is not truncation.
+            cut_points.append((index + 1, "".join(closers[c] for c in reversed(stack))))
+        elif char == "," and stack:
+            cut_points.append((index, "".join(closers[c] for c in reversed(stack))))
+
+    # Prefer cutting between array elements, so a half-written object is dropped
+    # rather than kept with some of its fields missing.
+    candidates = cut_points[-50:][::-1]
+    candidates.sort(key=lambda cut: not cut[1].startswith("]"))
+    for index, closing in candidates:
+        try:
+            return json.loads(text[:index] + closing)
+        except json.JSONDecodeError:
+            continue
+    return None
+
+def _scan_objects(text):
+    """Yields every well-formed JSON object in `text`, skipping malformed ones."""
+    decoder = json.JSONDecoder()
+    index = text.find("{")
+    while index != -1:
+        try:
+            item, end = decoder.raw_decode(text, index)
+        except json.JSONDecodeError:
+            index = text.find("{", index + 1)
+            continue
+        yield item
+        index = text.find("{", end)
+
+def parse_json(text, many=False):
+    """
+    Parses model output as JSON, salvaging what it can from malformed output.
+
+    Code fences and surrounding prose are ignored. A response cut off mid-way
+    (e.g. by the output token limit) is repaired to its last complete member.
+    With `many`, a list is always returned: a {"results": [...]}-style wrapper is
+    unwrapped, and as a last resort every well-formed object is collected.
+    Raises ValueError if nothing can be recovered.
+    """
+    cleaned = _strip_fences(text)
+    starts = [i for i in (cleaned.find("["), cleaned.find("{")) if i != -1]
+    body = cleaned[min(starts):] if starts else cleaned
+    try:
+        value, _ = json.JSONDecoder().raw_decode(body)
+    except json.JSONDecodeError:
+        value = _repair_truncated(body)
+        if value is None and many:
+            value = list(_scan_objects(body))
+        if value is None or value == []:
+            raise ValueError(f"Could not parse JSON from model output: {cleaned[:100]!r}")
+        logging.warning("Recovered partial JSON from malformed model output.")
+
+    if many:
+        if isinstance(value, dict):
+            lists = [v for v in value.values() if isinstance(v, list)]
+            value = lists[0] if lists else [value]
+        return value if isinstance(value, list) else [value]
+    return value
+
+def validate_items(items, model):
+    """Validates each item against `model`, dropping (and logging) the invalid ones."""
+    valid = []
+    for item in items:
+        try:
+            valid.append(item if isinstance(item, model) else model.model_validate(item))
+        except ValidationError as e:
+            logging.warning(f"Dropping invalid {model.__name__}: {e.errors()[0].get('msg')}")
+    return valid
+
+def generate_json(client, prompt, model, many=False, **kwargs):
+    """
+    Calls `client` in JSON mode with `model`'s response schema and validates the result.
+
+    Returns a `model` instance, or with `many` a list of the items that validated.
+    Raises ValueError (or ValidationError) if the output cannot be used.
+    """
+    kwargs.setdefault("generation_config", json_generation_config(model, many))
+    response = client.generate_content(prompt, **kwargs)
+    value = parse_json(response.text, many=many)
+    if many:
+        return validate_items(value, model)
+    return model.model_validate(value)
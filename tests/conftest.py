@@ -0,0 +1,19 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# The app modules (and benchmarks.fakes) are imported from the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fakes import CallCounter
+
+def http_error(status):
+    """An HttpError as the Google API client raises it for `status`."""
+    from googleapiclient.errors import HttpError
+    return HttpError(SimpleNamespace(status=status, reason=f"HTTP {status}"), b"")
+
+@pytest.fixture
+def counter():
+    return CallCounter()
@@ -0,0 +1,19 @@
+from agent.cache import AnalysisCache
+from state_backend import MemoryStateBackend
+
+def test_results_round_trip_including_not_a_todo():
+    cache = AnalysisCache(MemoryStateBackend())
+    cache.set_many({"m1": {"task": "Review"}, "m2": None}, "v1")
+    assert cache.get_many(["m1", "m2", "m3"], "v1") == {"m1": {"task": "Review"}, "m2": None}
+    assert cache.get_many(["m1"], "v2") == {}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+
+def test_size_cap_evicts_and_counts():
+    cache = AnalysisCache(MemoryStateBackend(), max_entries=3)
+    for i in range(5):
+        cache.set(f"m{i}", "v1", None)
+    stats = cache.stats()
+    assert stats["entries"] == 3
+    assert stats["evictions"] == 2
+    assert stats["max_entries"] == 3
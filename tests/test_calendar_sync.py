@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fakes import FakeCalendarService, make_calendar
+from calendar_integration.service import sync_calendar, sync_calendars
+from calendar_integration.store import EventStore
+from conftest import http_error
+
+class ScriptedCalendar(FakeCalendarService):
+    """
+    A FakeCalendarService whose incremental requests return `changes`, or raise
+    `errors[sync_token]`.
+    """
+
+    def __init__(self, events, counter, errors=None, changes=()):
+        super().__init__(events, counter, latency=0)
+        self.errors = errors or {}
+        self.changes = list(changes)
+
+    def list(self, calendarId, syncToken=None, **query):
+        if not syncToken:
+            return super().list(calendarId, **query)
+
+        def _execute():
+            self._counter.add("calendar.events.list")
+            if syncToken in self.errors:
+                raise self.errors[syncToken]
+            return {"items": self.changes, "nextSyncToken": "sync-2", "timeZone": "UTC"}
+        return SimpleNamespace(execute=_execute)
+
+@pytest.fixture
+def events():
+    return make_calendar(count=4)
+
+@pytest.fixture
+def store(tmp_path):
+    return EventStore(str(tmp_path / "calendar.sqlite3"))
+
+def _stored_ids(store):
+    return sorted(event["id"] for event in store.get_events(0, 2 ** 62))
+
+def test_first_sync_is_full_and_records_the_sync_token(events, store, counter):
+    sync_calendar(FakeCalendarService(events, counter, latency=0), store, "primary")
+    assert store.get_sync_state("primary") == ("sync-1", "UTC")
+    assert _stored_ids(store) == sorted(event["id"] for event in events)
+
+def test_expired_sync_token_resets_with_a_full_sync(events, store, counter):
+    store.replace_calendar("primary", [], "stale", "UTC")
+    service = ScriptedCalendar(events, counter, errors={"stale": http_error(410)})
+    sync_calendar(service, store, "primary")
+    assert counter.snapshot()["calendar.events.list"] == 2
+    assert store.get_sync_state("primary")[0] == "sync-1"
+    assert _stored_ids(store) == sorted(event["id"] for event in events)
+
+def test_other_errors_are_reported_as_failed_calendars(events, store, counter):
+    store.replace_calendar("primary", [], "token", "UTC")
+    service = ScriptedCalendar(events, counter, errors={"token": http_error(500)})
+    assert sync_calendars(store, ["primary"], service=service) == ["primary"]
+    assert store.get_sync_state("primary")[0] == "token"
+
+def test_incremental_sync_applies_changes_and_cancellations(events, store, counter):
+    sync_calendar(FakeCalendarService(events, counter, latency=0), store, "primary")
+    moved = {**events[1], "summary": "Moved"}
+    cancelled = {"id": events[0]["id"], "status": "cancelled"}
+    sync_calendar(ScriptedCalendar(events, counter, changes=[moved, cancelled]), store, "primary")
+    stored = {event["id"]: event for event in store.get_events(0, 2 ** 62)}
+    assert sorted(stored) == sorted(event["id"] for event in events[1:])
+    assert stored[moved["id"]]["summary"] == "Moved"
+    assert store.get_sync_state("primary")[0] == "sync-2"
@@ -0,0 +1,32 @@
+import json
+
+import context_manager
+from context_manager import ContextProvider
+
+def _write(path, context):
+    path.write_text(json.dumps(context))
+
+def test_profiles_are_cached_and_reloaded_on_change(tmp_path, monkeypatch):
+    monkeypatch.setattr(context_manager, "CONTEXT_DIR", str(tmp_path))
+    provider = ContextProvider(check_interval=0)
+    changes = []
+    provider.subscribe(lambda user_id, context: changes.append((user_id, context)))
+    _write(tmp_path / "alice.json", {"name": "Alice"})
+    assert provider.get("alice") == {"name": "Alice"}
+
+    _write(tmp_path / "alice.json", {"name": "Alice", "team": "Pulse"})
+    assert provider.get("alice") == {"name": "Alice", "team": "Pulse"}
+    assert changes == [("alice", {"name": "Alice", "team": "Pulse"})]
+
+def test_missing_profiles_are_not_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(context_manager, "CONTEXT_DIR", str(tmp_path))
+    provider = ContextProvider(check_interval=0)
+    for i in range(3):
+        assert provider.get(f"nobody{i}") == {}
+    assert provider._profiles == {}
+
+    _write(tmp_path / "bob.json", {"name": "Bob"})
+    assert provider.get("bob") == {"name": "Bob"}
+    (tmp_path / "bob.json").unlink()
+    assert provider.get("bob") == {}
+    assert "bob" not in provider._profiles
@@ -0,0 +1,65 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from agent import agent
+from benchmarks.fakes import make_inbox
+
+class FailingModel:
+    """A model whose every call fails, as under an exhausted quota."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, *args, **kwargs):
+        self.calls += 1
+        raise RuntimeError("429 Resource has been exhausted")
+
+class PartialBatchModel:
+    """Answers a batch with verdicts for only the first `answered` emails; single calls always succeed."""
+
+    def __init__(self, answered):
+        self.answered = answered
+        self.single_calls = 0
+
+    def generate_content(self, prompt, generation_config=None, **kwargs):
+        if generation_config["response_schema"]["type"] == "ARRAY":
+            ids = [line.split()[3] for line in prompt.splitlines() if "--- Email ID:" in line]
+            # An entry without an "id" cannot be matched to its email.
+            items = [{"id": message_id, "is_todo": "yes", "summary": "Do it"} for message_id in ids[:self.answered]]
+            items.append({"is_todo": "yes", "summary": "Whose is this?"})
+            return SimpleNamespace(text=json.dumps(items))
+        self.single_calls += 1
+        return SimpleNamespace(text=json.dumps({"is_todo": "no"}))
+
+@pytest.fixture
+def inbox():
+    return make_inbox(count=6, newsletter_ratio=0, seed=3)
+
+@pytest.mark.parametrize("batch", [True, False])
+def test_failed_analyses_are_reported_as_an_error(inbox, batch):
+    analysis = agent.analyze_emails(inbox, model_client=FailingModel(), cache=None, batch=batch, triage=False)
+    assert analysis["todos"] == []
+    assert analysis["failed"] == len(inbox)
+    assert "error" in analysis
+
+def test_streaming_raises_when_every_analysis_failed(inbox):
+    with pytest.raises(RuntimeError):
+        list(agent.iter_todos(inbox, model_client=FailingModel(), cache=None, triage=False))
+
+def test_no_emails_is_not_an_error():
+    assert agent.analyze_emails([], model_client=FailingModel(), cache=None) == {"todos": []}
+
+def test_failed_batch_call_is_not_resent_per_email(inbox):
+    model = FailingModel()
+    results = agent._analyze_batch(model, agent._parse_emails(inbox))
+    assert model.calls == 1
+    assert all(result is agent._FAILED for result in results.values())
+
+def test_only_emails_missing_from_a_batch_fall_back(inbox):
+    model = PartialBatchModel(answered=4)
+    results = agent._analyze_batch(model, agent._parse_emails(inbox))
+    assert model.single_calls == 2
+    assert [results[email["id"]] for email in inbox[:4]] == [{"task": "Do it", "link": ""}] * 4
+    assert [results[email["id"]] for email in inbox[4:]] == [None, None]
@@ -0,0 +1,154 @@
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fakes import FakeGmailService, make_inbox
+from conftest import http_error
+from gmail import service as gmail_service
+from gmail.service import get_todays_emails, incremental_sync, sync_inbox
+from gmail.store import MailboxStore
+
+class ScriptedGmail(FakeGmailService):
+    """A FakeGmailService whose history.list returns `records`, or raises `error`."""
+
+    def __init__(self, messages, counter, records=(), error=None):
+        super().__init__(messages, counter, latency=0)
+        self.records = list(records)
+        self.error = error
+
+    def history(self):
+        return SimpleNamespace(list=self._list_history)
+
+    def _list_history(self, userId, startHistoryId, **_):
+        def _execute():
+            self._counter.add("gmail.history.list")
+            if self.error is not None:
+                raise self.error
+            return {"history": self.records, "historyId": "2000"}
+        return SimpleNamespace(execute=_execute)
+
+class RateLimitedGmail(ScriptedGmail):
+    """A ScriptedGmail whose messages.get fails with a 429 for `failures[id]` more attempts."""
+
+    def __init__(self, messages, counter, failures, **kwargs):
+        super().__init__(messages, counter, **kwargs)
+        self.failures = dict(failures)
+
+    def get(self, userId, id, **kwargs):
+        request = super().get(userId, id, **kwargs)
+        if self.failures.get(id, 0) > 0:
+            self.failures[id] -= 1
+            request._respond = lambda: (_ for _ in ()).throw(http_error(429))
+        return request
+
+@pytest.fixture(autouse=True)
+def no_fetch_backoff(monkeypatch):
+    monkeypatch.setattr(gmail_service, "FETCH_RETRY_BACKOFF_SECONDS", 0)
+
+@pytest.fixture
+def inbox():
+    return make_inbox(count=6, newsletter_ratio=0, seed=1)
+
+@pytest.fixture
+def store(tmp_path):
+    return MailboxStore(str(tmp_path / "mailbox.sqlite3"))
+
+def _ids(messages):
+    return sorted(message["id"] for message in messages)
+
+def test_first_sync_is_full_and_later_syncs_incremental(inbox, store, counter):
+    service = FakeGmailService(inbox, counter, latency=0)
+    sync_inbox(service, store)
+    assert store.get_history_id() == "1000"
+    assert _ids(store.get_messages()) == _ids(inbox)
+
+    before = counter.snapshot()
+    sync_inbox(service, store)
+    calls = counter.snapshot() - before
+    assert calls["gmail.history.list"] == 1
+    assert calls["gmail.messages.list"] == 0 and calls["gmail.messages.get"] == 0
+
+def test_expired_history_falls_back_to_a_full_sync(inbox, store, counter):
+    store.replace_all(inbox[:2], "1")
+    service = ScriptedGmail(inbox, counter, error=http_error(404))
+    sync_inbox(service, store)
+    assert counter.snapshot()["gmail.history.list"] == 1
+    assert counter.snapshot()["gmail.messages.list"] == 1
+    assert store.get_history_id() == "1000"
+    assert _ids(store.get_messages()) == _ids(inbox)
+
+def test_other_history_errors_are_raised(inbox, store, counter):
+    store.replace_all(inbox, "1")
+    with pytest.raises(Exception) as raised:
+        sync_inbox(ScriptedGmail(inbox, counter, error=http_error(500)), store)
+    assert raised.value.resp.status == 500
+    assert counter.snapshot()["gmail.messages.list"] == 0
+
+def test_label_changes_are_applied_to_stored_messages(inbox, store, counter):
+    kept, read, trashed, marked_unread = inbox[:4]
+    store.replace_all([kept, read, trashed], "1")
+    records = [
+        {"labelsRemoved": [{"message": {"id": read["id"]}, "labelIds": ["UNREAD"]}]},
+        {"labelsAdded": [{"message": {"id": trashed["id"]}, "labelIds": ["TRASH"]}]},
+        # Not stored yet (it was read before the last sync), so it is downloaded.
+        {"labelsAdded": [{"message": {"id": marked_unread["id"]}, "labelIds": ["UNREAD"]}]},
+        {"labelsAdded": [{"message": {"id": kept["id"]}, "labelIds": ["STARRED"]}]},
+    ]
+    incremental_sync(ScriptedGmail(inbox, counter, records=records), store)
+
+    assert counter.snapshot()["gmail.messages.get"] == 1
+    assert store.get_history_id() == "2000"
+    assert _ids(store.get_messages()) == _ids([kept, read, marked_unread])
+    assert _ids(store.get_messages(label="UNREAD")) == _ids([kept, marked_unread])
+    stored_kept = next(m for m in store.get_messages() if m["id"] == kept["id"])
+    assert "STARRED" in stored_kept["labelIds"]
+
+def test_added_and_deleted_messages(inbox, store, counter):
+    store.replace_all(inbox[:2], "1")
+    added, spam, gone = inbox[2], inbox[3], inbox[0]
+    records = [
+        {"messagesAdded": [{"message": {"id": added["id"], "labelIds": ["UNREAD", "INBOX"]}}]},
+        {"messagesAdded": [{"message": {"id": spam["id"], "labelIds": ["UNREAD", "SPAM"]}}]},
+        {"messagesDeleted": [{"message": {"id": gone["id"]}}]},
+    ]
+    incremental_sync(ScriptedGmail(inbox, counter, records=records), store)
+    assert _ids(store.get_messages()) == _ids([inbox[1], added])
+
+def test_failed_sync_serves_stored_messages(inbox, store, counter):
+    store.replace_all(inbox[:3], "1")
+    emails = get_todays_emails(ScriptedGmail(inbox, counter, error=http_error(503)), store=store)
+    assert _ids(emails) == _ids(inbox[:3])
+
+def test_failed_first_sync_returns_none(inbox, store, counter):
+    service = ScriptedGmail(inbox, counter)
+    service.getProfile = lambda userId: SimpleNamespace(execute=lambda: (_ for _ in ()).throw(http_error(503)))
+    assert get_todays_emails(service, store=store) is None
+
+def test_rate_limited_messages_are_retried(inbox, store, counter):
+    flaky = inbox[1]["id"]
+    sync_inbox(RateLimitedGmail(inbox, counter, {flaky: 1}), store)
+    assert _ids(store.get_messages()) == _ids(inbox)
+    assert store.get_pending() == []
+
+def test_messages_that_keep_failing_are_fetched_by_the_next_sync(inbox, store, counter):
+    store.replace_all(inbox[:2], "1")
+    failing = inbox[2]["id"]
+    records = [{"messagesAdded": [{"message": {"id": m["id"], "labelIds": ["UNREAD"]}}]} for m in inbox[2:4]]
+    service = RateLimitedGmail(inbox, counter, {failing: gmail_service.FETCH_RETRIES + 1}, records=records)
+    incremental_sync(service, store)
+    assert store.get_history_id() == "2000"
+    assert store.get_pending() == [failing]
+    assert failing not in _ids(store.get_messages())
+
+    # The history since "2000" no longer mentions the message, but it is still fetched.
+    service.records = []
+    incremental_sync(service, store)
+    assert store.get_pending() == []
+    assert _ids(store.get_messages()) == _ids(inbox[:4])
+
+def test_pending_messages_deleted_meanwhile_are_dropped(inbox, store, counter):
+    store.replace_all(inbox[:2], "1", pending=[inbox[2]["id"]])
+    records = [{"messagesDeleted": [{"message": {"id": inbox[2]["id"]}}]}]
+    incremental_sync(ScriptedGmail(inbox, counter, records=records), store)
+    assert store.get_pending() == []
+    assert counter.snapshot()["gmail.messages.get"] == 0
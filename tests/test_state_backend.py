@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from state_backend import MemoryStateBackend, SQLiteStateBackend, run_once
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStateBackend()
+    return SQLiteStateBackend(str(tmp_path / "state.sqlite3"))
+
+def test_lease_is_exclusive_until_released(backend):
+    token = backend.acquire_lock("refresh", ttl_seconds=30)
+    assert token is not None
+    assert backend.acquire_lock("refresh", ttl_seconds=30) is None
+    assert backend.acquire_lock("other", ttl_seconds=30) is not None
+    backend.release_lock("refresh", token)
+    assert backend.acquire_lock("refresh", ttl_seconds=30) is not None
+
+def test_only_the_holder_can_release_a_lease(backend):
+    token = backend.acquire_lock("refresh", ttl_seconds=30)
+    backend.release_lock("refresh", "not-the-token")
+    assert backend.acquire_lock("refresh", ttl_seconds=30) is None
+    backend.release_lock("refresh", token)
+
+def test_expired_lease_can_be_taken_over(backend):
+    stale = backend.acquire_lock("refresh", ttl_seconds=0.05)
+    time.sleep(0.1)
+    token = backend.acquire_lock("refresh", ttl_seconds=30)
+    assert token is not None
+    # The previous holder's late release must not free the new lease.
+    backend.release_lock("refresh", stale)
+    assert backend.acquire_lock("refresh", ttl_seconds=30) is None
+
+def test_sqlite_lease_is_shared_between_connections(tmp_path):
+    path = str(tmp_path / "state.sqlite3")
+    first, second = SQLiteStateBackend(path), SQLiteStateBackend(path)
+    token = first.acquire_lock("refresh", ttl_seconds=30)
+    assert second.acquire_lock("refresh", ttl_seconds=30) is None
+    first.release_lock("refresh", token)
+    assert second.acquire_lock("refresh", ttl_seconds=30) is not None
+
+def test_run_once_computes_once_and_shares_the_result(backend):
+    computed = []
+    results = []
+    started = threading.Event()
+
+    def compute():
+        computed.append(1)
+        started.set()
+        time.sleep(0.2)
+        backend.set("runs", "today", {"todos": 3})
+        return {"todos": 3}
+
+    def run():
+        results.append(run_once(backend, "run:today", compute, lambda: backend.get("runs", "today"), 30,
+                                poll_interval=0.02))
+
+    leader = threading.Thread(target=run)
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=run) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert len(computed) == 1
+    assert results == [{"todos": 3}] * 4
+
+def test_run_once_takes_over_from_a_holder_that_died(backend):
+    backend.acquire_lock("run:today", ttl_seconds=0.1)  # Never released.
+    result = run_once(backend, "run:today", lambda: "recomputed", lambda: None, 30, poll_interval=0.02)
+    assert result == "recomputed"
+
+def test_trim_evicts_the_oldest_entries(backend):
+    for i in range(5):
+        backend.set("cache", f"k{i}", i, ttl_seconds=100 + i)
+    backend.set("other", "k", "kept", ttl_seconds=1)
+    assert backend.trim("cache", 3) == 2
+    assert backend.trim("cache", 3) == 0
+    assert sorted(backend.get_many("cache", [f"k{i}" for i in range(5)])) == ["k2", "k3", "k4"]
+    assert backend.get("other", "k") == "kept"
@@ -0,0 +1,134 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from pydantic import ValidationError
+
+from structured_output import (
+    BatchEmailAnalysis, EmailAnalysis, PulseItem, Recommendations, _repair_truncated, generate_json, parse_json,
+    response_schema, validate_items,
+)
+
+ITEMS = [
+    {"id": "m1", "is_todo": True, "task": "Review the design doc"},
+    {"id": "m2", "is_todo": False, "task": None},
+    {"id": "m3", "is_todo": True, "task": "Reply to Alex, \"urgent\" [today]"},
+]
+
+def test_complete_json_is_parsed_as_is():
+    assert parse_json(json.dumps(ITEMS), many=True) == ITEMS
+
+def test_fences_and_prose_are_ignored():
+    text = f"Here are the results:\n```json\n{json.dumps(ITEMS[0])}\n```"
+    assert parse_json(text) == ITEMS[0]
+
+@pytest.mark.parametrize("cut", [
+    # Mid-way through the last object's string value.
+    lambda text: text[:text.index("Reply to") + 5],
+    # Right after the last object's opening brace.
+    lambda text: text[:text.rindex("{") + 1],
+    # Inside an escaped quote in the last object.
+    lambda text: text[:text.index('\\"urgent') + 2],
+])
+def test_truncated_array_keeps_only_complete_items(cut):
+    truncated = cut(json.dumps(ITEMS))
+    assert parse_json(truncated, many=True) == ITEMS[:2]
+
+def test_truncated_wrapper_object_is_unwrapped():
+    truncated = json.dumps({"results": ITEMS})[:-20]
+    assert parse_json(truncated, many=True) == ITEMS[:2]
+
+def test_brackets_inside_strings_do_not_confuse_the_repair():
+    text = json.dumps([{"task": "close ] and } in text"}, {"task": "cut here"}])
+    assert _repair_truncated(text[:-10]) == [{"task": "close ] and } in text"}]
+
+def test_repair_leaves_complete_values_alone():
+    assert _repair_truncated(json.dumps(ITEMS) + " trailing") is None
+
+def test_malformed_objects_are_salvaged_with_many():
+    text = '[{"id": "m1"}, {"id": m2}, {"id": "m3"}]'
+    assert parse_json(text, many=True) == [{"id": "m1"}, {"id": "m3"}]
+
+def test_unrecoverable_output_raises():
+    with pytest.raises(ValueError):
+        parse_json("I could not find any to-dos.", many=True)
+
+# --- Models ---
+@pytest.mark.parametrize("value, expected", [
+    ("yes", True), (" Yes ", True), ("true", True), ("y", True),
+    ("no", False), ("maybe", False), (True, True), (1, True), (0, False), (None, False),
+])
+def test_is_todo_accepts_yes_no_answers(value, expected):
+    assert EmailAnalysis.model_validate({"is_todo": value}).is_todo is expected
+
+def test_missing_or_null_text_fields_become_empty():
+    analysis = EmailAnalysis.model_validate({"is_todo": "yes", "summary": None, "link": None})
+    assert (analysis.summary, analysis.link) == ("", "")
+    assert PulseItem.model_validate({"subject": "Launch", "update": "Shipped", "link": None}).link == ""
+
+def test_batch_entries_need_an_id():
+    assert BatchEmailAnalysis.model_validate({"id": 42, "is_todo": "no"}).id == "42"
+    with pytest.raises(ValidationError):
+        BatchEmailAnalysis.model_validate({"is_todo": "yes"})
+
+def test_validate_items_drops_only_invalid_entries():
+    kept = PulseItem(subject="Kept", update="As an instance")
+    items = validate_items([{"subject": "A", "update": "B"}, {"subject": "No update"}, "not an object", kept], PulseItem)
+    assert [item.subject for item in items] == ["A", "Kept"]
+    assert items[1] is kept
+
+def test_recommendations_drop_invalid_items_and_non_lists():
+    recommendations = Recommendations.model_validate({
+        "role_specific_upskilling": [{"recommendation": "Learn Go", "reason": "Backend work"}, {"reason": "No title"}],
+        "trending_topics": "not a list",
+    })
+    assert [r.recommendation for r in recommendations.role_specific_upskilling] == ["Learn Go"]
+    assert recommendations.trending_topics == []
+    assert recommendations.internal_events == []
+
+# --- Response schemas ---
+def test_response_schema_lists_types_and_required_fields():
+    assert response_schema(PulseItem) == {
+        "type": "OBJECT",
+        "properties": {"subject": {"type": "STRING"}, "update": {"type": "STRING"}, "link": {"type": "STRING"}},
+        "required": ["subject", "update"],
+    }
+    batch = response_schema(BatchEmailAnalysis, many=True)
+    assert batch["type"] == "ARRAY"
+    assert batch["items"]["properties"]["is_todo"] == {"type": "BOOLEAN"}
+    assert batch["items"]["required"] == ["id"]
+
+def test_response_schema_nests_models_in_lists():
+    events = response_schema(Recommendations)["properties"]["internal_events"]
+    assert events["type"] == "ARRAY"
+    assert events["items"]["required"] == ["recommendation"]
+
+# --- generate_json ---
+class RecordingClient:
+    def __init__(self, text):
+        self.text = text
+        self.calls = []
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls.append((prompt, kwargs))
+        return SimpleNamespace(text=self.text)
+
+def test_generate_json_requests_json_mode_with_the_schema():
+    client = RecordingClient('```json\n{"is_todo": "yes", "summary": "Reply"}\n```')
+    analysis = generate_json(client, "prompt", EmailAnalysis, cache_ttl=60)
+    assert analysis == EmailAnalysis(is_todo=True, summary="Reply")
+    _, kwargs = client.calls[0]
+    assert kwargs["cache_ttl"] == 60
+    assert kwargs["generation_config"] == {
+        "response_mime_type": "application/json", "response_schema": response_schema(EmailAnalysis),
+    }
+
+def test_generate_json_many_keeps_the_valid_items():
+    client = RecordingClient('[{"subject": "A", "update": "B"}, {"subject": "C"}]')
+    assert generate_json(client, "prompt", PulseItem, many=True) == [PulseItem(subject="A", update="B")]
+
+def test_generate_json_raises_on_unusable_output():
+    with pytest.raises(ValueError):
+        generate_json(RecordingClient("Sorry, no JSON today."), "prompt", EmailAnalysis)
+    with pytest.raises(ValidationError):
+        generate_json(RecordingClient('{"subject": "No update"}'), "prompt", PulseItem)
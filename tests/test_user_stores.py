@@ -0,0 +1,38 @@
+import sqlite3
+
+import pytest
+
+import user_stores
+from auth import http_status
+from conftest import http_error
+from user_stores import UserStores, store_path
+
+class Store:
+    def __init__(self, path):
+        self.path = path
+
+def test_each_user_gets_their_own_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(user_stores, "STORE_DIR", str(tmp_path))
+    stores = UserStores(Store, "mailbox.sqlite3")
+    assert stores.get().path == str(tmp_path / "mailbox.sqlite3")
+    assert stores.get("alice").path == str(tmp_path / "users" / "alice" / "mailbox.sqlite3")
+    assert stores.get("alice") is stores.get("alice")
+
+def test_malformed_user_ids_are_rejected():
+    with pytest.raises(ValueError):
+        store_path("mailbox.sqlite3", "../alice")
+
+def test_a_store_that_cannot_be_opened_is_not_cached():
+    attempts = []
+
+    def broken(path):
+        attempts.append(path)
+        raise sqlite3.OperationalError("unable to open database file")
+
+    stores = UserStores(broken, "mailbox.sqlite3")
+    assert stores.get() is None and stores.get() is None
+    assert len(attempts) == 2
+
+def test_http_status():
+    assert http_status(http_error(410)) == 410
+    assert http_status(ValueError("no response")) is None
@@ -0,0 +1,40 @@
+import logging
+import os
+import sqlite3
+import threading
+from context_manager import validate_user_id
+
+STORE_DIR = os.getenv("FRIDAY_CACHE_DIR", ".friday_cache")
+
+def store_path(filename, user_id=None):
+    """The default user's store is STORE_DIR/`filename`; other users get their own file under STORE_DIR/users/."""
+    if user_id is None:
+        return os.path.join(STORE_DIR, filename)
+    return os.path.join(STORE_DIR, "users", validate_user_id(user_id), filename)
+
+class UserStores:
+    """
+    Process-wide stores of one kind, one per user, each opened on first use
+    as `store_class(store_path(filename, user_id))`.
+    """
+
+    def __init__(self, store_class, filename):
+        self.store_class = store_class
+        self.filename = filename
+        self._stores = {}  # user_id -> store
+        self._lock = threading.Lock()
+
+    def get(self, user_id=None):
+        """Returns the store for `user_id` (or the default user), or None if it cannot be opened."""
+        store = self._stores.get(user_id)
+        if store is None:
+            with self._lock:
+                store = self._stores.get(user_id)
+                if store is None:
+                    path = store_path(self.filename, user_id)
+                    try:
+                        store = self._stores[user_id] = self.store_class(path)
+                    except sqlite3.Error as e:
+                        logging.error(f"Could not open {self.store_class.__name__} at {path}: {e}")
+                        return None
+        return store